@@ -1,5 +1,5 @@
 from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
@@ -50,3 +50,37 @@ def approve_subscription(
     # For now, we trust is_premium=True means handled.
     db.commit()
     return {"message": "User approved and set to Premium"}
+
+@router.get("/metrics")
+def read_metrics(
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+
+    from backend.app.services.answer_cache import answer_cache
+    from backend.app.services.context_packing import context_stats
+    from backend.app.services.rag import rag_service
+    from backend.app.services.vector_gc import vector_gc
+    return {
+        **rag_service.stats(),
+        "answer_cache": answer_cache.stats(),
+        "context_packing": context_stats.stats(),
+        "vector_gc": vector_gc.last_report,
+    }
+
+@router.post("/vector-gc", status_code=202)
+def run_vector_gc(
+    background_tasks: BackgroundTasks,
+    compact: bool = True,
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Schedules a garbage collection of orphaned vectors; the report appears in /admin/metrics.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+
+    from backend.app.services.vector_gc import vector_gc
+    background_tasks.add_task(vector_gc.run, compact)
+    return {"message": "Vector garbage collection scheduled"}
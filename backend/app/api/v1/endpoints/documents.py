@@ -1,16 +1,23 @@
 import os
 import logging
-from typing import Any, List
+from functools import partial
+from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
 from backend.app.api import deps
 from backend.app.models import User, Project, Document
-from backend.app.db.base import get_db
+from backend.app.db.base import get_db, SessionLocal
 from backend.app.core.config import settings
-from backend.app.services.ingestion import process_pdf
-from backend.app.services.rag import rag_service
+from backend.app.services.ingestion import (
+    SpooledUpload, UploadTooLarge, chunker_config, index_document, reindex_document, spool_upload
+)
+from backend.app.services.jobs import IngestionJob, JobStatus, job_queue
+from backend.app.services import page_cache
+from backend.app.services.analysis import analysis_service
+from backend.app.services.answer_cache import answer_cache
+from backend.app.services.embeddings import embedding_model_id
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -20,11 +27,172 @@ class DocumentResponse(BaseModel):
     filename: str
     is_indexed: bool
     uploaded_at: Any
+    job_id: Optional[str] = None # Set on upload; poll /documents/jobs/{job_id} for progress
     
     class Config:
         from_attributes = True
 
-@router.post("/{project_id}/documents/upload", response_model=List[DocumentResponse])
+class IngestionJobResponse(BaseModel):
+    id: str
+    document_id: int
+    filename: str
+    status: JobStatus
+    total_pages: int
+    pages_processed: int
+    chunks_embedded: int
+    chunks_reused: int
+    chunks_deleted: int
+    chunks_relocated: int
+    failed_batches: int
+    error: Optional[str] = None
+
+def _ingest_document(job: IngestionJob, upload: SpooledUpload, storage_path: str):
+    """
+    Background job body: upload to storage, then stream the PDF into the vector store.
+    Runs on a job worker thread, so it owns its own DB session.
+    """
+    try:
+        # Upload to Supabase
+        _store_upload(upload, storage_path)
+
+        # 3. Process PDF (Text Extraction) + 4. RAG Indexing
+        # Parsed straight from the spooled upload (memory-mapped when on disk).
+        # Pages stream through chunking, embedding and upsert in bounded batches.
+        with upload.open() as file_stream:
+            index_document(
+                file_stream, job.filename, job.project_id, job.document_id,
+                progress=job.progress, source_path=upload.path, content_hash=upload.content_hash
+            )
+    finally:
+        upload.cleanup()
+
+    if not job.progress.chunks_embedded or job.progress.failed_batches:
+        raise ValueError(f"{job.progress.failed_batches} batch(es) failed to index")
+
+    _mark_indexed(job.document_id)
+
+def _store_upload(upload: SpooledUpload, storage_path: str):
+    from backend.app.services.storage import storage_service
+
+    with upload.open() as stream:
+        storage_service.upload_stream(stream, upload.size, storage_path, content_type="application/pdf")
+
+def _reuse_document(job: IngestionJob, source_project_id: int, source_document_id: int):
+    """
+    Background job body for an upload whose bytes were already ingested:
+    copies the existing chunks and embeddings instead of parsing and embedding again.
+    """
+    from backend.app.services.rag import rag_service
+
+    job.progress.chunks_embedded = rag_service.copy_document_vectors(
+        source_project_id, source_document_id, job.project_id, job.document_id, source=job.filename
+    )
+    if not job.progress.chunks_embedded:
+        raise ValueError(f"No vectors found to reuse from document {source_document_id}")
+
+    _mark_indexed(job.document_id)
+
+def _reindex_document(
+    job: IngestionJob,
+    upload: Optional[SpooledUpload],
+    storage_path: Optional[str],
+    old_file_path: str,
+    content_hash: str,
+    full: bool = False,
+):
+    """
+    Background job body for a re-index: only new or changed chunks are embedded,
+    and vectors of chunks that disappeared are removed.
+    Without a new upload the stored file is re-chunked, from the page cache when possible.
+    """
+    from backend.app.services.storage import storage_service
+
+    # Opened once here: an entry pruned or evicted later cannot vanish mid-job
+    cached = page_cache.get(content_hash) if upload is None else None
+    if upload is None and cached is None:
+        # Cache miss: fetch the stored file once (and cache its pages on the way through)
+        local_path = storage_service.download_to_temp(storage_service.path_from_url(old_file_path))
+        upload = SpooledUpload(size=os.path.getsize(local_path), content_hash=content_hash, path=local_path)
+        storage_path = None
+
+    try:
+        if upload is not None and storage_path:
+            _store_upload(upload, storage_path)
+
+        if cached is not None:
+            # Served entirely from the page cache; the PDF is never opened
+            reindex_document(
+                cached, job.filename, job.project_id, job.document_id,
+                progress=job.progress, content_hash=content_hash, full=full
+            )
+        else:
+            with upload.open() as file_stream:
+                reindex_document(
+                    file_stream, job.filename, job.project_id, job.document_id,
+                    progress=job.progress, source_path=upload.path, content_hash=content_hash, full=full
+                )
+    finally:
+        if cached is not None:
+            cached.close()
+        if upload is not None:
+            upload.cleanup()
+
+    if job.progress.failed_batches:
+        raise ValueError(f"{job.progress.failed_batches} batch(es) failed to index")
+
+    # Reused chunks keep their vectors: the recorded model only changes with a full re-embed
+    _mark_indexed(job.document_id, embedded=full)
+
+    if storage_path:
+        db = SessionLocal()
+        try:
+            _remove_file_if_unreferenced(db, old_file_path, exclude_document_id=job.document_id)
+        finally:
+            db.close()
+
+def _mark_indexed(document_id: int, embedded: bool = True):
+    """
+    Marks a document searchable and records the chunker (and, if every vector was just
+    built or copied from a matching document, the embedding model) of its vectors.
+    """
+    db = SessionLocal()
+    try:
+        db_doc = db.query(Document).filter(Document.id == document_id).first()
+        if db_doc:
+            db_doc.is_indexed = True
+            db_doc.chunker_config = chunker_config()
+            if embedded:
+                db_doc.embedding_model = embedding_model_id()
+            db.commit()
+            # New content is searchable now: cached answers may be incomplete
+            answer_cache.invalidate(db_doc.project_id)
+            analysis_service.schedule_precompute(db_doc.project_id)
+    finally:
+        db.close()
+
+def _remove_file_if_unreferenced(db: Session, file_path: str, exclude_document_id: int):
+    """
+    Deletes a storage object unless another Document still points at it
+    (deduplicated uploads share one object).
+    """
+    from backend.app.services.storage import storage_service
+
+    shared = db.query(Document).filter(
+        Document.file_path == file_path,
+        Document.id != exclude_document_id
+    ).first()
+    if shared:
+        return
+
+    # We stored the FULL URL in file_path; storage needs the path inside the bucket.
+    try:
+        relative_path = storage_service.path_from_url(file_path)
+        if relative_path:
+            storage_service.delete_file(relative_path)
+    except Exception as e:
+        logger.error(f"Failed to delete file from storage: {e}")
+
+@router.post("/{project_id}/documents/upload", response_model=List[DocumentResponse], status_code=202)
 async def upload_documents(
     project_id: int,
     files: List[UploadFile] = File(...),
@@ -45,69 +213,173 @@ async def upload_documents(
         if not file.filename.lower().endswith('.pdf'):
             continue # Skip non-PDFs for now
             
+        upload = None
         try:
-            # Read unique file content into memory
-            # Note: For very large files, this might need chunked upload, but standard PDFs are fine.
-            content = await file.read()
-            
-            # Create a unique path: project_id/timestamp_filename
-            import time
-            timestamp = int(time.time())
-            storage_path = f"project_{project_id}/{timestamp}_{file.filename}"
-            
-            # Upload to Supabase
-            public_url = storage_service.upload_file(content, storage_path, content_type="application/pdf")
+            # Read the upload in chunks: small files stay in memory, large ones spool to disk
+            upload = await spool_upload(file)
+            content_hash = upload.content_hash
+
+            # Same bytes already ingested (e.g. the same paper in another project) with the
+            # current embedding model and chunker? Then share its storage object and reuse its chunks/vectors.
+            existing_doc = db.query(Document).filter(
+                Document.content_hash == content_hash,
+                Document.is_indexed == True,
+                Document.embedding_model == embedding_model_id(),
+                Document.chunker_config == chunker_config()
+            ).first()
+
+            if existing_doc:
+                file_path = existing_doc.file_path
+            else:
+                # Create a unique path: project_id/timestamp_filename
+                import time
+                timestamp = int(time.time())
+                storage_path = f"project_{project_id}/{timestamp}_{file.filename}"
+                file_path = storage_service.public_url(storage_path)
             
             # Create DB Record
             db_doc = Document(
                 project_id=project.id,
                 filename=file.filename,
-                file_path=public_url, # Store URL or Storage Path? URL is better for frontend access.
-                file_size=len(content),
+                file_path=file_path, # Store URL or Storage Path? URL is better for frontend access.
+                file_size=upload.size,
+                content_hash=content_hash,
                 is_indexed=False
             )
             db.add(db_doc)
             db.commit() # Commit to get ID
             
-            # 3. Process PDF (Text Extraction)
-            # Since we are stateless, we can either:
-            # a) Download from URL (adds latency)
-            # b) Use the 'content' bytes we already have (fastest)
-            
-            from backend.app.services.ingestion import extract_text_from_bytes_and_chunk
-            
-            # We need to adapt ingestion.py to handle BYTES instead of file path
-            # For now, let's write to a temp file if PyPDF2 strictness requires it, or use io.BytesIO
-            import io
-            file_stream = io.BytesIO(content)
-            
-            chunk_dicts = extract_text_from_bytes_and_chunk(file_stream, filename=file.filename)
-            
-            texts = [c["text"] for c in chunk_dicts]
-            
-            # 4. RAG Indexing
-            # Add Source Metadata + Page Numbers
-            metadatas = []
-            for c in chunk_dicts:
-                meta = c["metadata"]
-                meta["document_id"] = db_doc.id # Add DB ID to metadata
-                meta["source"] = file.filename # Ensure source is friendly name
-                metadatas.append(meta)
-            
-            if rag_service.add_documents(project.id, texts, metadatas):
-                db_doc.is_indexed = True
-                db.commit()
+            # 2. Hand storage upload + indexing to the background queue
+            job = IngestionJob(project_id=project.id, document_id=db_doc.id, filename=file.filename)
+            if existing_doc:
+                logger.info(f"{file.filename} matches document {existing_doc.id}, reusing its vectors")
+                upload.cleanup() # Nothing to parse or store
+                job_queue.submit(job, partial(
+                    _reuse_document, source_project_id=existing_doc.project_id, source_document_id=existing_doc.id
+                ))
+            else:
+                job_queue.submit(job, partial(_ingest_document, upload=upload, storage_path=storage_path))
+            upload = None # Owned by the job now
             
-            uploaded_docs.append(db_doc)
+            uploaded_docs.append(DocumentResponse.model_validate(db_doc).model_copy(update={"job_id": job.id}))
 
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
         except Exception as e:
             logger.error(f"Failed to process file {file.filename}: {e}")
+            if upload is not None:
+                upload.cleanup() # Don't leave the spooled temp file behind
             # db.delete(db_doc) # Optional: Delete on failure
             # db.commit()
             raise HTTPException(status_code=500, detail=f"Error processing {file.filename}: {str(e)}")
 
+    answer_cache.invalidate(project_id)
     return uploaded_docs
 
+@router.post("/{project_id}/documents/{document_id}/reindex", response_model=DocumentResponse, status_code=202)
+async def reindex_document_upload(
+    project_id: int,
+    document_id: int,
+    file: Optional[UploadFile] = File(None),
+    full: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Re-indexes a document from a revised upload, or, without a file, re-chunks the stored one
+    (e.g. after a CHUNK_SIZE change). `full=true` re-embeds every chunk (e.g. after a model change).
+    """
+    project = db.query(Project).filter(Project.id == project_id, Project.user_id == current_user.id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    document = db.query(Document).filter(Document.id == document_id, Document.project_id == project_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    from backend.app.services.storage import storage_service
+
+    upload = None
+    storage_path = None
+    old_file_path = document.file_path
+
+    if file is not None:
+        if not file.filename.lower().endswith('.pdf'):
+            raise HTTPException(status_code=400, detail="Only PDF files can be re-indexed")
+
+        try:
+            upload = await spool_upload(file)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+        # The revision gets its own object; the old one is removed once the job succeeds
+        import time
+        timestamp = int(time.time())
+        storage_path = f"project_{project_id}/{timestamp}_{file.filename}"
+
+        document.file_path = storage_service.public_url(storage_path)
+        document.file_size = upload.size
+        document.content_hash = upload.content_hash
+    elif not document.content_hash:
+        raise HTTPException(status_code=400, detail="Document predates content hashing; upload the file to re-index it")
+
+    if document.embedding_model and document.embedding_model != embedding_model_id():
+        # Vectors of another model can't be mixed with new ones
+        full = True
+
+    document.is_indexed = False
+    try:
+        db.commit()
+        answer_cache.invalidate(project_id)
+
+        # Keep the document's original name as the chunk source
+        job = IngestionJob(project_id=project.id, document_id=document.id, filename=document.filename)
+        job_queue.submit(job, partial(
+            _reindex_document,
+            upload=upload,
+            storage_path=storage_path,
+            old_file_path=old_file_path,
+            content_hash=document.content_hash,
+            full=full,
+        ))
+    except Exception:
+        # Not handed to a job: don't leave the spooled temp file behind
+        if upload is not None:
+            upload.cleanup()
+        raise
+
+    return DocumentResponse.model_validate(document).model_copy(update={"job_id": job.id})
+
+@router.get("/{project_id}/documents/jobs/{job_id}", response_model=IngestionJobResponse)
+def read_ingestion_job(
+    project_id: int,
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    project = db.query(Project).filter(Project.id == project_id, Project.user_id == current_user.id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    job = job_queue.get(job_id)
+    if not job or job.project_id != project_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return IngestionJobResponse(
+        id=job.id,
+        document_id=job.document_id,
+        filename=job.filename,
+        status=job.status,
+        total_pages=job.progress.total_pages,
+        pages_processed=job.progress.pages_processed,
+        chunks_embedded=job.progress.chunks_embedded,
+        chunks_reused=job.progress.chunks_reused,
+        chunks_deleted=job.progress.chunks_deleted,
+        chunks_relocated=job.progress.chunks_relocated,
+        failed_batches=job.progress.failed_batches,
+        error=job.error,
+    )
+
 @router.get("/{project_id}/documents", response_model=List[DocumentResponse])
 def read_documents(
     project_id: int,
@@ -136,28 +408,15 @@ def delete_document(
         raise HTTPException(status_code=404, detail="Document not found")
         
     # Delete from Supabase Storage
-    # Extract path from URL or logic?
-    # Logic: "project_{id}/{timestamp}_{filename}"
-    # But we stored the FULL URL in file_path. We need to extract the relative path.
-    # URL: .../uploads/project_8/123_file.pdf
-    # Bucket: "uploads"
-    # We need: "project_8/123_file.pdf"
-    
-    from backend.app.services.storage import storage_service
-    
-    try:
-        if document.file_path and "storage/v1/object/public/" in document.file_path:
-            # Extract path suffix
-            # Split by bucket name
-            parts = document.file_path.split(f"/{storage_service.BUCKET_NAME}/")
-            if len(parts) > 1:
-                relative_path = parts[1]
-                storage_service.delete_file(relative_path)
-    except Exception as e:
-        logger.error(f"Failed to delete file from storage: {e}")
+    _remove_file_if_unreferenced(db, document.file_path, exclude_document_id=document.id)
+
+    # Delete its vectors so searches stop scoring dead chunks
+    from backend.app.services.rag import rag_service
+    rag_service.delete_document_vectors(project_id, document.id)
     
     # Remove from DB
     db.delete(document)
     db.commit()
+    answer_cache.invalidate(project_id)
     
     return None
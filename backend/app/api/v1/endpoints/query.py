@@ -1,14 +1,26 @@
-from typing import Any, List
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Callable, List, Optional, Set
 from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, selectinload
 from pydantic import BaseModel
 
 from backend.app.api import deps
-from backend.app.models import User, Project, AnalysisResult, ChatMessage, ChatRole
-from backend.app.db.base import get_db
+from backend.app.models import User, Project, ChatMessage, ChatRole
+from backend.app.core.config import settings
+from backend.app.models.project import MessageType
+from backend.app.db.base import get_db, SessionLocal
+from backend.app.services.analysis import analysis_service
+from backend.app.services.answer_cache import answer_cache, answer_scope, corpus_fingerprint
+from backend.app.services.context_packing import chat_header, context_stats, pack_context
+from backend.app.services.conversation_memory import conversation_memory
 from backend.app.services.rag import rag_service
 from backend.app.services.reasoning import reasoning_service
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 class ChatRequest(BaseModel):
@@ -31,203 +43,208 @@ class AnalysisResponse(BaseModel):
     missing_evaluations: List[str] = []
     unexplored_scenarios: List[str] = []
 
+NO_CONTEXT_FALLBACK = "No specific documents found in the database. Please answer based on general research principles or theoretical knowledge, but clearly state that no specific project documents were cited."
+
+def _get_project(db: Session, project_id: int, user: User) -> Project:
+    # Blocking: handlers run it via asyncio.to_thread. Documents are loaded eagerly so the
+    # handler can use them on the event loop without a lazy query.
+    project = db.query(Project).options(selectinload(Project.documents)).filter(
+        Project.id == project_id, Project.user_id == user.id
+    ).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project
+
+def _target_doc_ids(project: Project, document_ids: List[int]) -> Set[int]:
+    valid_doc_ids = {doc.id for doc in project.documents} # Set for O(1) lookup
+    if document_ids:
+        # If user selected specific docs, intersect with valid docs to ensure they exist
+        return valid_doc_ids.intersection(set(document_ids))
+    return valid_doc_ids
+
+def _chat_context(context_docs: List[dict]) -> str:
+    # Format context with "Reality" headers for the LLM, within the token budget
+    packed = pack_context(context_docs, settings.CHAT_CONTEXT_TOKEN_BUDGET, header=chat_header)
+    context_stats.record("Chat", packed)
+    return packed.text
+
+def _research_context(context_docs: List[dict]) -> str:
+    packed = pack_context(context_docs, settings.RESEARCH_CONTEXT_TOKEN_BUDGET)
+    context_stats.record("Research", packed)
+    # Context might be empty, but we let the LLM handle it with general knowledge or a polite explanation.
+    return packed.text or NO_CONTEXT_FALLBACK
+
+def _save_exchange(db: Session, project_id: int, message_type: MessageType, question: str, answer: str):
+    user_msg = ChatMessage(project_id=project_id, role=ChatRole.USER, content=question, message_type=message_type)
+    ai_msg = ChatMessage(project_id=project_id, role=ChatRole.ASSISTANT, content=answer, message_type=message_type)
+    db.add(user_msg)
+    db.add(ai_msg)
+    db.commit()
+    conversation_memory.schedule_update(project_id, message_type)
+
+def _save_exchange_in_new_session(project_id: int, message_type: MessageType, question: str, answer: str):
+    # The request's session is closed by the time a stream finishes
+    db = SessionLocal()
+    try:
+        _save_exchange(db, project_id, message_type, question, answer)
+    finally:
+        db.close()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_tokens(
+    tokens: AsyncIterator[str],
+    project_id: int,
+    message_type: MessageType,
+    question: str,
+    done: dict,
+    on_answer: Optional[Callable[[str], None]] = None,
+):
+    """
+    Forwards generated text as `token` events. Once the model has finished, the full
+    answer is saved to the chat history and a final `done` event carries it.
+    """
+    parts = []
+    try:
+        async for token in tokens:
+            parts.append(token)
+            yield _sse("token", {"text": token})
+    except Exception as e:
+        logger.error(f"Streaming failed for project {project_id}: {e}")
+        yield _sse("error", {"detail": str(e)})
+        return
+
+    answer = "".join(parts)
+    await asyncio.to_thread(_save_exchange_in_new_session, project_id, message_type, question, answer)
+    if on_answer:
+        on_answer(answer)
+    yield _sse("done", {**done, "answer": answer})
+
+async def _replay(text: str) -> AsyncIterator[str]:
+    yield text
+
+def _event_stream(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the client as they are sent
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/{project_id}/query/chat", response_model=ChatResponse)
-def project_chat(
+async def project_chat(
     project_id: int,
     request: ChatRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(deps.get_current_user),
 ) -> Any:
-    project = db.query(Project).filter(Project.id == project_id, Project.user_id == current_user.id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    project = await asyncio.to_thread(_get_project, db, project_id, current_user)
 
     # 1. Prepare Valid Docs Filter
-    valid_doc_ids = {doc.id for doc in project.documents} # Set for O(1) lookup
-    
-    target_doc_ids = valid_doc_ids
-    if request.document_ids:
-        # If user selected specific docs, intersect with valid docs to ensure they exist
-        target_doc_ids = valid_doc_ids.intersection(set(request.document_ids))
+    target_doc_ids = _target_doc_ids(project, request.document_ids)
     
     try:
-        # 1. Retrieve Context
-        k_val = 5
-        if request.document_ids:
-            # We fetch more candidates to ensure we have enough after filtering
-            k_val = 20
-        
-        context_docs = rag_service.similarity_search(project_id, request.query, k=k_val)
-        
-        # Strict Filter: Only allow documents that are currently in the Project DB
-        filtered_docs = []
-        for doc in context_docs:
-            doc_id = doc.get("metadata", {}).get("document_id")
-            if doc_id in target_doc_ids:
-                filtered_docs.append(doc)
-        
-        context_docs = filtered_docs[:5] # Take top 5 valid docs
-        
-        # Format context with "Reality" headers for the LLM
-        context_chunks = []
-        for doc in context_docs:
-            meta = doc.get("metadata", {})
-            source = meta.get("source", "Unknown")
-            page = meta.get("page", "?")
-            content = doc.get("content", "")
-            context_chunks.append(f"[Document: {source} | Page: {page}]\n{content}")
-        
-        context_text = "\n\n".join(context_chunks)
-        
-        # 2. Retrieve Chat History
-        from backend.app.models.project import MessageType
-        history_records = db.query(ChatMessage).filter(
-            ChatMessage.project_id == project_id,
-            ChatMessage.message_type == MessageType.CHAT
-        ).order_by(ChatMessage.created_at.desc()).limit(10).all()
-        history_records.reverse()
-        
-        chat_history_text = ""
-        for msg in history_records:
-            role_label = "User" if msg.role == ChatRole.USER else "Assistant"
-            chat_history_text += f"{role_label}: {msg.content}\n\n"
+        # 1. Retrieve Chat History (part of the answer cache scope: follow-ups depend on it)
+        chat_history_text = await asyncio.to_thread(conversation_memory.history, db, project_id, MessageType.CHAT)
+
+        # 2. Near-duplicate question on the same corpus version, selection and conversation: reuse the answer
+        fingerprint = corpus_fingerprint(project.documents)
+        scope = answer_scope(current_user.id, target_doc_ids, chat_history_text)
+        query_embedding = await asyncio.to_thread(rag_service.embed_query, request.query)
+        cached = answer_cache.lookup(project_id, fingerprint, scope, query_embedding)
+        if cached:
+            await asyncio.to_thread(_save_exchange, db, project_id, MessageType.CHAT, request.query, cached["answer"])
+            return cached
+
+        # 3. Retrieve Context (only chunks of documents currently in the project/selection)
+        context_docs = await rag_service.asimilarity_search(project_id, request.query, k=5, document_ids=target_doc_ids)
+        context_text = _chat_context(context_docs)
     
-        # 3. Get Answer
-        answer = reasoning_service.get_answer(request.query, context_text, chat_history_text)
+        # 4. Get Answer
+        answer = await reasoning_service.aget_answer(request.query, context_text, chat_history_text)
         
-        # 4. Save History (filter duplicates or handle same session logic)
-        user_msg = ChatMessage(project_id=project_id, role=ChatRole.USER, content=request.query, message_type=MessageType.CHAT)
-        ai_msg = ChatMessage(project_id=project_id, role=ChatRole.ASSISTANT, content=answer, message_type=MessageType.CHAT)
-        db.add(user_msg)
-        db.add(ai_msg)
-        db.commit()
+        # 5. Save History (filter duplicates or handle same session logic)
+        await asyncio.to_thread(_save_exchange, db, project_id, MessageType.CHAT, request.query, answer)
     
-        return {"answer": answer, "sources": []}
+        result = {"answer": answer, "sources": []}
+        answer_cache.store(project_id, fingerprint, scope, query_embedding, result)
+        return result
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/{project_id}/query/chat/stream")
+async def project_chat_stream(
+    project_id: int,
+    request: ChatRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Streaming variant of /query/chat as server-sent events:
+    `token` ({"text"}) per generated fragment, then `done` ({"answer", "sources"}) or `error` ({"detail"}).
+    """
+    project = await asyncio.to_thread(_get_project, db, project_id, current_user)
+    target_doc_ids = _target_doc_ids(project, request.document_ids)
+
+    chat_history_text = await asyncio.to_thread(conversation_memory.history, db, project_id, MessageType.CHAT)
+    fingerprint = corpus_fingerprint(project.documents)
+    scope = answer_scope(current_user.id, target_doc_ids, chat_history_text)
+    query_embedding = await asyncio.to_thread(rag_service.embed_query, request.query)
+    cached = answer_cache.lookup(project_id, fingerprint, scope, query_embedding)
+    if cached:
+        return _event_stream(_stream_tokens(
+            _replay(cached["answer"]), project_id, MessageType.CHAT, request.query, {"sources": cached["sources"]}
+        ))
+
+    context_docs = await rag_service.asimilarity_search(project_id, request.query, k=5, document_ids=target_doc_ids)
+    context_text = _chat_context(context_docs)
+
+    def cache_answer(answer: str):
+        answer_cache.store(project_id, fingerprint, scope, query_embedding, {"answer": answer, "sources": []})
+
+    tokens = reasoning_service.astream_answer(request.query, context_text, chat_history_text)
+    return _event_stream(_stream_tokens(
+        tokens, project_id, MessageType.CHAT, request.query, {"sources": []}, on_answer=cache_answer
+    ))
+
 @router.post("/{project_id}/query/analyze", response_model=AnalysisResponse)
-def analyze_project(
+async def analyze_project(
     project_id: int,
+    mode: Optional[str] = None, # "single", "map_reduce" or "auto"; default ANALYSIS_MODE
+    refresh: bool = False, # Recompute even if the documents have not changed
     db: Session = Depends(get_db),
     current_user: User = Depends(deps.get_current_user),
 ) -> Any:
-    project = db.query(Project).filter(Project.id == project_id, Project.user_id == current_user.id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    project = await asyncio.to_thread(_get_project, db, project_id, current_user)
 
-    # 1. Gather Broad Context (naive approach: get generic chunks or random sample)
-    # Ideally search for "summary", "conclusion", "limitations"
-    queries = ["limitations", "future work", "conclusion", "methodology"]
-    
-    # 1. Prepare Valid Docs Filter
-    valid_doc_ids = {doc.id for doc in project.documents}
-    
-    context_docs = []
-    for q in queries:
-        results = rag_service.similarity_search(project_id, q, k=5) # increased k to allow filtering
-        # Strict Filter
-        for doc in results:
-            doc_id = doc.get("metadata", {}).get("document_id")
-            if doc_id in valid_doc_ids:
-                context_docs.append(doc)
-    
-    # Extract text content from dicts and deduplicate
-    unique_contents = set()
-    for doc in context_docs:
-        if isinstance(doc, dict):
-            unique_contents.add(doc.get("content", ""))
-        else:
-            unique_contents.add(str(doc))
-            
-    combined_context = "\n\n".join(unique_contents)
-    
-    if not combined_context:
-        raise HTTPException(status_code=400, detail="Not enough documents to analyze.")
+    try:
+        return await analysis_service.analyze(db, project, mode=mode, refresh=refresh)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 2. Perform Analysis
-    result = reasoning_service.analyze_project(combined_context)
-    
-    # 3. Save/Update Result
-    analysis_entry = db.query(AnalysisResult).filter(AnalysisResult.project_id == project_id).first()
-    if not analysis_entry:
-        analysis_entry = AnalysisResult(
-            project_id=project_id,
-            research_gaps=result.get("research_gaps", []),
-            methodology_suggestions=result.get("methodology_suggestions", []),
-            common_approaches=result.get("common_approaches", []),
-            missing_evaluations=result.get("missing_evaluations", []),
-            unexplored_scenarios=result.get("unexplored_scenarios", [])
-        )
-        db.add(analysis_entry)
-    else:
-        analysis_entry.research_gaps = result.get("research_gaps", [])
-        analysis_entry.methodology_suggestions = result.get("methodology_suggestions", [])
-        analysis_entry.common_approaches = result.get("common_approaches", [])
-        analysis_entry.missing_evaluations = result.get("missing_evaluations", [])
-        analysis_entry.unexplored_scenarios = result.get("unexplored_scenarios", [])
-    
-    db.commit()
-    
-    return result
 @router.post("/{project_id}/query/research")
-def deep_research(
+async def deep_research(
     project_id: int,
     request: ChatRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(deps.get_current_user),
 ) -> Any:
-    project = db.query(Project).filter(Project.id == project_id, Project.user_id == current_user.id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    project = await asyncio.to_thread(_get_project, db, project_id, current_user)
 
     # 1. Broad Retrieval (Get more context for deep research)
-    # Prepare Valid Docs Filter
-    valid_doc_ids = {doc.id for doc in project.documents}
-
-    context_docs_raw = rag_service.similarity_search(project_id, request.query, k=20)
-    
-    # Strict Filter
-    context_docs = []
-    for doc in context_docs_raw:
-        doc_id = doc.get("metadata", {}).get("document_id")
-        if doc_id in valid_doc_ids:
-            context_docs.append(doc)
-    
-    # Extract text content
-    context_text_list = []
-    for doc in context_docs:
-        if isinstance(doc, dict):
-            context_text_list.append(doc.get("content", ""))
-        else:
-            context_text_list.append(str(doc))
-            
-    context_text = "\n\n".join(context_text_list)
-    
-    # Context might be empty, but we let the LLM handle it with general knowledge or a polite explanation.
-    if not context_text:
-        context_text = "No specific documents found in the database. Please answer based on general research principles or theoretical knowledge, but clearly state that no specific project documents were cited."
+    valid_doc_ids = _target_doc_ids(project, [])
+    context_docs = await rag_service.asimilarity_search(project_id, request.query, k=20, document_ids=valid_doc_ids)
+    context_text = _research_context(context_docs)
 
     # 2. Retrieve Chat History
     # IMPORTANT: Only retrieve research history!
-    from backend.app.models.project import MessageType
-    history_records = db.query(ChatMessage).filter(
-        ChatMessage.project_id == project_id,
-        ChatMessage.message_type == MessageType.RESEARCH
-    ).order_by(ChatMessage.created_at.desc()).limit(10).all()
-    
-    # Reverse to chronological order
-    history_records.reverse()
-    
-    chat_history_text = ""
-    for msg in history_records:
-        role_label = "User" if msg.role == ChatRole.USER else "Assistant"
-        chat_history_text += f"{role_label}: {msg.content}\n\n"
+    chat_history_text = await asyncio.to_thread(conversation_memory.history, db, project_id, MessageType.RESEARCH)
 
     # 3. Generate Report
-    result = reasoning_service.perform_deep_research(
+    result = await reasoning_service.aperform_deep_research(
         query=request.query, 
         context=context_text, 
         chat_history=chat_history_text,
@@ -237,10 +254,35 @@ def deep_research(
     
     # 3. Save as a chat message for history (optional, or just return)
     # We'll save it so it appears in the chat
-    user_msg = ChatMessage(project_id=project_id, role=ChatRole.USER, content=f"[Deep Research] {request.query}", message_type=MessageType.RESEARCH)
-    ai_msg = ChatMessage(project_id=project_id, role=ChatRole.ASSISTANT, content=result["report"], message_type=MessageType.RESEARCH)
-    db.add(user_msg)
-    db.add(ai_msg)
-    db.commit()
+    await asyncio.to_thread(_save_exchange, db, project_id, MessageType.RESEARCH, f"[Deep Research] {request.query}", result["report"])
 
     return result
+
+@router.post("/{project_id}/query/research/stream")
+async def deep_research_stream(
+    project_id: int,
+    request: ChatRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Streaming variant of /query/research as server-sent events:
+    `token` ({"text"}) per generated fragment, then `done` ({"answer"}) or `error` ({"detail"}).
+    """
+    project = await asyncio.to_thread(_get_project, db, project_id, current_user)
+    valid_doc_ids = _target_doc_ids(project, [])
+
+    context_docs = await rag_service.asimilarity_search(project_id, request.query, k=20, document_ids=valid_doc_ids)
+    context_text = _research_context(context_docs)
+    chat_history_text = await asyncio.to_thread(conversation_memory.history, db, project_id, MessageType.RESEARCH)
+
+    tokens = reasoning_service.astream_research(
+        query=request.query,
+        context=context_text,
+        chat_history=chat_history_text,
+        project_title=project.title,
+        project_description=project.description or "No description provided."
+    )
+    return _event_stream(
+        _stream_tokens(tokens, project_id, MessageType.RESEARCH, f"[Deep Research] {request.query}", {})
+    )
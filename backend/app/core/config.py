@@ -19,14 +19,143 @@ class Settings(BaseSettings):
     # Supabase (Storage & Vectors)
     SUPABASE_URL: Optional[str] = None
     SUPABASE_KEY: Optional[str] = None
+    # Connection pool shared by storage and vector calls (HTTP/2 needs the h2 package).
+    SUPABASE_MAX_CONNECTIONS: int = 50
+    SUPABASE_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    SUPABASE_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    SUPABASE_HTTP2: bool = False
     
     # Google Gemini
     GOOGLE_API_KEY: str
     CHAT_MODEL: str = "gemini-2.5-flash"
     RESEARCH_MODEL: str = "gemini-3-flash-preview"
+    # Async LLM calls: concurrent requests per model, deadline per attempt, retries with
+    # exponential backoff from LLM_RETRY_BACKOFF_SECONDS, and a hedged duplicate request
+    # after LLM_HEDGE_AFTER_SECONDS without an answer (0 = no hedging). Streams fail after
+    # LLM_STREAM_IDLE_TIMEOUT_SECONDS without a new fragment (the first one included).
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_TIMEOUT_SECONDS: float = 120
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BACKOFF_SECONDS: float = 1.0
+    LLM_HEDGE_AFTER_SECONDS: float = 0
+    LLM_STREAM_IDLE_TIMEOUT_SECONDS: float = 60
     
     # Uploads
     UPLOAD_DIR: str = "uploads"
+    # Uploads larger than this are rejected with 413 (bytes).
+    MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024
+    # Uploads above this size are spooled to a temp file instead of held in memory (bytes).
+    UPLOAD_SPOOL_THRESHOLD: int = 5 * 1024 * 1024
+    # Read/write granularity for spooling and streaming uploads to storage (bytes).
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    # Ingestion
+    # Number of processes used to extract PDF pages. 1 keeps extraction in-process.
+    INGESTION_WORKERS: int = 1
+    # Documents shorter than this are always extracted serially (pool overhead dominates).
+    INGESTION_PARALLEL_MIN_PAGES: int = 40
+    # "native" (offset-based, single-pass cleaning) or "recursive" (LangChain splitter).
+    INGESTION_CHUNKER: str = "native"
+    # Chunks embedded and upserted per vector store call.
+    INGESTION_BATCH_SIZE: int = 64
+    # Parsed batches buffered ahead of the embedder; bounds peak memory per upload.
+    INGESTION_QUEUE_DEPTH: int = 2
+    # Background ingestion jobs processed concurrently per server process.
+    INGESTION_QUEUE_WORKERS: int = 2
+    # How long finished job statuses stay available for polling.
+    INGESTION_JOB_RETENTION_SECONDS: int = 3600
+
+    # Parsed page text cache (keyed by file hash), so re-chunking skips PDF parsing.
+    PAGE_CACHE_ENABLED: bool = True
+    PAGE_CACHE_DIR: str = ".page_cache"
+    PAGE_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+
+    # Embeddings: "huggingface" (PyTorch sentence-transformers) or "onnx" (exported model,
+    # e.g. int8-quantized MiniLM produced by export_onnx_model.py, loaded from ONNX_MODEL_PATH).
+    EMBEDDING_BACKEND: str = "huggingface"
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    ONNX_MODEL_PATH: Optional[str] = None
+    ONNX_MODEL_FILE: str = "model_quantized.onnx"
+    # onnxruntime intra-op threads (0 = runtime default).
+    ONNX_NUM_THREADS: int = 0
+
+    # Load the embedding model in the background right after startup (otherwise on first use).
+    EMBEDDING_WARMUP_ON_STARTUP: bool = True
+
+    # Concurrent embedding calls are coalesced into one forward pass of up to
+    # EMBEDDING_BATCH_MAX_SIZE texts, waiting at most EMBEDDING_BATCH_MAX_WAIT_MS for company.
+    EMBEDDING_BATCH_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_SIZE: int = 64
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    # Query embedding cache (entries; TTL of 0 disables expiry). Cache keys ignore case only
+    # when the loaded tokenizer lowercases (read from its config); EMBEDDING_LOWERCASE overrides that.
+    EMBEDDING_LOWERCASE: Optional[bool] = None
+    QUERY_EMBEDDING_CACHE_SIZE: int = 2048
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS: float = 0
+
+    # Vector store: "supabase" (shared pgvector table) or "faiss" (one local index per
+    # project under FAISS_INDEX_DIR, memory-mapped on load; requires faiss-cpu). Server
+    # processes may share FAISS_INDEX_DIR: saves take a file lock (POSIX only) and merge what
+    # the others saved, and open indexes reload once another process saved.
+    VECTOR_STORE_BACKEND: str = "supabase"
+    FAISS_INDEX_DIR: str = ".faiss_index"
+    # Project indexes kept open at once (least recently used are closed).
+    FAISS_MAX_OPEN_INDEXES: int = 32
+    # Added vectors are written to disk once per ingested document, or after this many
+    # seconds of a long ingestion (the index file is rewritten whole on every save).
+    FAISS_SAVE_INTERVAL_SECONDS: float = 30
+    # Concurrent vector store round trips for one multi-query search (Supabase).
+    VECTOR_SEARCH_CONCURRENCY: int = 8
+
+    # Per-project BM25 inverted index (SQLite files under SPARSE_INDEX_DIR), built at ingestion.
+    SPARSE_INDEX_ENABLED: bool = True
+    SPARSE_INDEX_DIR: str = ".sparse_index"
+    SPARSE_MAX_OPEN_INDEXES: int = 32
+    # Retrieval: "dense" (vectors only) or "hybrid" (BM25 and vector rankings fused with
+    # reciprocal rank fusion). In hybrid mode the vector search fetches at most HYBRID_DENSE_K
+    # candidates (BM25 recovers the exact-term matches a smaller dense k misses) and BM25 at
+    # least HYBRID_SPARSE_K; RRF_K damps the weight of top ranks. See bench_retrieval.py.
+    RETRIEVAL_MODE: str = "hybrid"
+    HYBRID_DENSE_K: int = 8
+    HYBRID_SPARSE_K: int = 20
+    RRF_K: int = 60
+
+    # Semantic answer cache for project chat: a query whose embedding has at least
+    # ANSWER_CACHE_SIMILARITY cosine similarity to a cached one (same corpus version and
+    # document selection, user and chat history) reuses its answer. Bounded per project and
+    # LRU across projects.
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY: float = 0.95
+    ANSWER_CACHE_MAX_PROJECTS: int = 256
+    ANSWER_CACHE_ENTRIES_PER_SCOPE: int = 64
+
+    # Prompt context packing: retrieved chunks are merged per page (chunk overlaps kept once)
+    # and added by relevance up to these budgets, in tokens estimated as chars / CONTEXT_CHARS_PER_TOKEN.
+    CHAT_CONTEXT_TOKEN_BUDGET: int = 2000
+    RESEARCH_CONTEXT_TOKEN_BUDGET: int = 6000
+    CONTEXT_CHARS_PER_TOKEN: float = 4.0
+
+    # Project analysis: "single" (one prompt over chunks retrieved project-wide), "map_reduce"
+    # (a summary per document, ANALYSIS_MAP_CONCURRENCY at a time, merged by one final call) or
+    # "auto" (map_reduce from ANALYSIS_MAP_REDUCE_MIN_DOCUMENTS indexed documents on).
+    ANALYSIS_MODE: str = "auto"
+    ANALYSIS_MAP_REDUCE_MIN_DOCUMENTS: int = 4
+    ANALYSIS_MAP_CONCURRENCY: int = 4
+    ANALYSIS_MAP_CHUNKS_PER_QUERY: int = 3
+    ANALYSIS_MAP_TOKEN_BUDGET: int = 2500
+    # Compute the analysis in the background once all of a project's documents are indexed
+    ANALYSIS_PRECOMPUTE: bool = False
+
+    # Conversation memory: the last MEMORY_RECENT_MESSAGES messages of a chat/research
+    # conversation are sent verbatim (each cut at MEMORY_MESSAGE_MAX_CHARS), older ones as a
+    # rolling summary of at most MEMORY_SUMMARY_MAX_WORDS, updated in the background.
+    MEMORY_RECENT_MESSAGES: int = 4
+    MEMORY_MESSAGE_MAX_CHARS: int = 1500
+    MEMORY_SUMMARY_MAX_WORDS: int = 250
+    MEMORY_SUMMARY_BATCH: int = 20 # Messages folded into the summary per LLM call
+
+    # Periodic removal of vectors whose project/document was deleted (0 = only via /admin/vector-gc).
+    VECTOR_GC_INTERVAL_SECONDS: float = 0
 
     class Config:
         env_file = ".env"
@@ -1,7 +1,7 @@
 import logging
 from backend.app.db.base import engine, Base
 # Import all models so Base.metadata has them registered
-from backend.app.models import User, Project, Document, ChatMessage, AnalysisResult
+from backend.app.models import User, Project, Document, ChatMessage, AnalysisResult, ConversationMemory
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
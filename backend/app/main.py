@@ -1,5 +1,7 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from backend.app.core.config import settings
 from backend.app.api.v1.api import api_router
 from backend.app.db.base import engine, Base
@@ -27,6 +29,36 @@ def startup_event():
     # For this project, we create tables on startup if not exist.
     Base.metadata.create_all(bind=engine)
 
+    # Serve immediately; the embedding model loads in the background (see /ready)
+    if settings.EMBEDDING_WARMUP_ON_STARTUP:
+        from backend.app.services.rag import rag_service
+        rag_service.warm_up()
+
+    if settings.VECTOR_GC_INTERVAL_SECONDS:
+        from backend.app.services.vector_gc import vector_gc
+        vector_gc.start_schedule(settings.VECTOR_GC_INTERVAL_SECONDS)
+
+    if settings.ANALYSIS_PRECOMPUTE:
+        from backend.app.services.analysis import analysis_service
+        analysis_service.bind_loop(asyncio.get_running_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from backend.app.services.rag import rag_service
+    from backend.app.services.supabase_client import supabase_clients
+    rag_service.flush_vectors()
+    await supabase_clients.aclose()
+    supabase_clients.close()
+
 @app.get("/")
 def root():
     return {"message": "Welcome to AI Project Researcher API"}
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 503 until the embedding model has loaded.
+    """
+    from backend.app.services.rag import rag_service
+    status = rag_service.readiness()
+    return JSONResponse(status_code=200 if status["embedding_model_loaded"] else 503, content=status)
@@ -1,3 +1,3 @@
 from .user import User
-from .project import Project, Document, ChatMessage, AnalysisResult, ChatRole
+from .project import Project, Document, ChatMessage, AnalysisResult, ConversationMemory, ChatRole
 from backend.app.db.base import Base # Export Base so Alembic can find metadata
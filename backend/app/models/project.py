@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, JSON, Enum
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, JSON, Enum, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -26,6 +26,7 @@ class Project(Base):
     documents = relationship("Document", back_populates="project", cascade="all, delete-orphan")
     chats = relationship("ChatMessage", back_populates="project", cascade="all, delete-orphan")
     analysis = relationship("AnalysisResult", back_populates="project", uselist=False, cascade="all, delete-orphan")
+    memories = relationship("ConversationMemory", back_populates="project", cascade="all, delete-orphan")
 
 class Document(Base):
     __tablename__ = "documents"
@@ -37,6 +38,10 @@ class Document(Base):
     file_size = Column(Integer)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     is_indexed = Column(Boolean, default=False)
+    content_hash = Column(String, index=True, nullable=True) # SHA-256 of the uploaded bytes
+    # What the stored vectors were built with; vectors are only reused while both match
+    embedding_model = Column(String, nullable=True) # embedding_model_id()
+    chunker_config = Column(String, nullable=True) # ingestion.chunker_config()
     
     project = relationship("Project", back_populates="documents")
 
@@ -64,6 +69,24 @@ class AnalysisResult(Base):
     common_approaches = Column(JSON, default=list)
     missing_evaluations = Column(JSON, default=list)
     unexplored_scenarios = Column(JSON, default=list)
+    fingerprint = Column(String, nullable=True) # Inputs the result was computed from, see AnalysisService.fingerprint
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     project = relationship("Project", back_populates="analysis")
+
+class ConversationMemory(Base):
+    """
+    Rolling summary of a project's chat or research conversation: messages up to
+    summarized_until_id are folded into `summary`, later ones are sent verbatim.
+    """
+    __tablename__ = "conversation_memories"
+    __table_args__ = (UniqueConstraint("project_id", "message_type"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
+    message_type = Column(Enum(MessageType, values_callable=lambda x: [e.value for e in x]), nullable=False)
+    summary = Column(Text, nullable=False, default="")
+    summarized_until_id = Column(Integer, nullable=False, default=0) # Last ChatMessage.id in the summary
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    project = relationship("Project", back_populates="memories")
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session, selectinload
+from backend.app.core.config import settings
+from backend.app.models import Project, Document, AnalysisResult
+from backend.app.services.answer_cache import corpus_fingerprint
+from backend.app.services.context_packing import chat_header, pack_context
+from backend.app.services.rag import rag_service
+from backend.app.services.reasoning import ANALYSIS_ERROR_RESULT, ANALYSIS_PROMPT_VERSION, reasoning_service
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_QUERIES = ["limitations", "future work", "conclusion", "methodology"]
+# Per-document retrieval for the map step of map-reduce analysis
+SUMMARY_QUERIES = ["methodology", "evaluation datasets and metrics", "results", "limitations and future work"]
+
+RESULT_FIELDS = ["research_gaps", "methodology_suggestions", "common_approaches", "missing_evaluations", "unexplored_scenarios"]
+
+class AnalysisService:
+    """
+    Gap analysis of a project. The stored AnalysisResult carries a fingerprint of the
+    document set, models, prompt version and mode it was computed from, and is returned
+    as is while that fingerprint still matches.
+    """
+    _instance = None
+    _locks: Dict[int, asyncio.Lock] = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AnalysisService, cls).__new__(cls)
+            cls._locks = {}
+        return cls._instance
+
+    def resolve_mode(self, project: Project, mode: Optional[str] = None) -> str:
+        mode = mode or settings.ANALYSIS_MODE
+        if mode == "auto":
+            indexed = sum(1 for doc in project.documents if doc.is_indexed)
+            mode = "map_reduce" if indexed >= settings.ANALYSIS_MAP_REDUCE_MIN_DOCUMENTS else "single"
+        if mode not in ("single", "map_reduce"):
+            raise ValueError(f"Unknown analysis mode: {mode}")
+        return mode
+
+    def fingerprint(self, project: Project, mode: str) -> str:
+        models = [settings.RESEARCH_MODEL] + ([settings.CHAT_MODEL] if mode == "map_reduce" else [])
+        parts = [corpus_fingerprint(project.documents), ANALYSIS_PROMPT_VERSION, mode, *models]
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    async def analyze(self, db: Session, project: Project, mode: Optional[str] = None, refresh: bool = False) -> dict:
+        """
+        Returns the project's analysis, recomputing it only when the fingerprint changed
+        or `refresh` is set. Raises ValueError if there is nothing to analyze.
+        """
+        mode = self.resolve_mode(project, mode)
+        fingerprint = self.fingerprint(project, mode)
+
+        # One computation per project at a time; a concurrent request waits and reuses its result
+        lock = self._locks.setdefault(project.id, asyncio.Lock())
+        async with lock:
+            stored = None if refresh else await asyncio.to_thread(self._stored_result, db, project.id, fingerprint)
+            if stored is not None:
+                logger.info(f"Reusing stored analysis of project {project.id}")
+                return stored
+
+            if mode == "map_reduce":
+                indexed_documents = [doc for doc in project.documents if doc.is_indexed]
+                combined_context = await self._map_reduce_context(project.id, indexed_documents)
+            else:
+                combined_context = await self._single_pass_context(project)
+
+            if not combined_context:
+                raise ValueError("Not enough documents to analyze.")
+
+            result = await reasoning_service.aanalyze_project(combined_context)
+            # A failed run is shown but not reused
+            await asyncio.to_thread(
+                self._save_result, db, project.id, result, None if result == ANALYSIS_ERROR_RESULT else fingerprint
+            )
+            return result
+
+    # Blocking database helpers, run through asyncio.to_thread
+
+    def _stored_result(self, db: Session, project_id: int, fingerprint: str) -> Optional[dict]:
+        analysis_entry = db.query(AnalysisResult).filter(AnalysisResult.project_id == project_id).first()
+        if analysis_entry and analysis_entry.fingerprint == fingerprint:
+            return {field: getattr(analysis_entry, field) or [] for field in RESULT_FIELDS}
+        return None
+
+    def _save_result(self, db: Session, project_id: int, result: dict, fingerprint: Optional[str]):
+        analysis_entry = db.query(AnalysisResult).filter(AnalysisResult.project_id == project_id).first()
+        if not analysis_entry:
+            analysis_entry = AnalysisResult(project_id=project_id)
+            db.add(analysis_entry)
+        for field in RESULT_FIELDS:
+            setattr(analysis_entry, field, result.get(field, []))
+        analysis_entry.fingerprint = fingerprint
+        db.commit()
+
+    def _load_project(self, db: Session, project_id: int) -> Optional[Project]:
+        return db.query(Project).options(selectinload(Project.documents)).filter(Project.id == project_id).first()
+
+    async def _single_pass_context(self, project: Project) -> str:
+        valid_doc_ids = {doc.id for doc in project.documents}
+
+        # One batched embedding + concurrent searches for all queries
+        result = await rag_service.asimilarity_search_many(project.id, ANALYSIS_QUERIES, k=5, document_ids=valid_doc_ids)
+
+        # Extract text content from dicts and deduplicate
+        unique_contents = set()
+        for doc in result["merged"]:
+            if isinstance(doc, dict):
+                unique_contents.add(doc.get("content", ""))
+            else:
+                unique_contents.add(str(doc))
+
+        return "\n\n".join(unique_contents)
+
+    async def _map_reduce_context(self, project_id: int, documents: List[Document]) -> str:
+        """
+        Map step: each document is retrieved from and summarized on its own, at most
+        ANALYSIS_MAP_CONCURRENCY at a time, so wall time follows the slowest document.
+        The labelled summaries are the context of the single reduce call.
+        """
+        semaphore = asyncio.Semaphore(settings.ANALYSIS_MAP_CONCURRENCY)
+
+        async def summarize(document: Document) -> Optional[str]:
+            async with semaphore:
+                result = await rag_service.asimilarity_search_many(
+                    project_id, SUMMARY_QUERIES, k=settings.ANALYSIS_MAP_CHUNKS_PER_QUERY, document_ids={document.id}
+                )
+                if not result["merged"]:
+                    return None
+                packed = pack_context(result["merged"], settings.ANALYSIS_MAP_TOKEN_BUDGET, header=chat_header)
+                summary = await reasoning_service.asummarize_document(document.filename, packed.text)
+            return f"[Paper: {document.filename}]\n{summary}" if summary else None
+
+        summaries = await asyncio.gather(*(summarize(document) for document in documents))
+        return "\n\n".join(summary for summary in summaries if summary)
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """
+        The server's event loop, which background precomputation is submitted to
+        (the LLM and Supabase async clients belong to it).
+        """
+        type(self)._loop = loop
+
+    def schedule_precompute(self, project_id: int):
+        """
+        Called from ingestion workers once a document is indexed: when the whole project
+        is indexed, its analysis is computed in the background so the next request reuses it.
+        """
+        if not settings.ANALYSIS_PRECOMPUTE or self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._precompute(project_id), self._loop)
+
+    async def _precompute(self, project_id: int):
+        from backend.app.db.base import SessionLocal
+
+        db = SessionLocal()
+        try:
+            project = await asyncio.to_thread(self._load_project, db, project_id)
+            if not project or not project.documents or not all(doc.is_indexed for doc in project.documents):
+                return
+            await self.analyze(db, project)
+        except Exception as e:
+            logger.error(f"Analysis precompute failed for project {project_id}: {e}")
+        finally:
+            await asyncio.to_thread(db.close)
+
+analysis_service = AnalysisService()
@@ -0,0 +1,113 @@
+import hashlib
+import math
+import threading
+from typing import Collection, Hashable, Iterable, List, Optional
+from backend.app.core.cache import LRUCache
+from backend.app.core.config import settings
+
+def corpus_fingerprint(documents: Iterable) -> str:
+    """
+    Identifies the current version of a project's document set: changes whenever a
+    document is added, removed, re-indexed with new content or finishes indexing.
+    """
+    parts = sorted(f"{doc.id}:{doc.content_hash or doc.file_path}:{int(bool(doc.is_indexed))}" for doc in documents)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+def answer_scope(user_id: int, document_ids: Collection[int], chat_history: str) -> tuple:
+    """
+    Cache scope of a chat answer: the asking user, the searched documents and the
+    conversation state sent with the question (the same follow-up means different
+    things after different exchanges).
+    """
+    history_hash = hashlib.sha256(chat_history.encode("utf-8")).hexdigest()
+    return (user_id, frozenset(document_ids), history_hash)
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+class AnswerCache:
+    """
+    Semantic cache of chat answers. Per project it keeps the answers for the current corpus
+    fingerprint, grouped by answer_scope() (user, searched documents, chat history); a query
+    whose embedding is within ANSWER_CACHE_SIMILARITY (cosine) of a cached one gets that answer.
+    Projects are evicted LRU; entries for an older fingerprint are dropped on the next store.
+    """
+    _instance = None
+    _projects: LRUCache = None
+    _lock: threading.Lock = None
+    hits = 0
+    misses = 0
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AnswerCache, cls).__new__(cls)
+            cls._projects = LRUCache(max_size=settings.ANSWER_CACHE_MAX_PROJECTS)
+            cls._lock = threading.Lock()
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ANSWER_CACHE_ENABLED
+
+    def lookup(
+        self,
+        project_id: int,
+        fingerprint: str,
+        scope: Hashable,
+        embedding: List[float],
+    ) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        best = None
+        best_score = settings.ANSWER_CACHE_SIMILARITY
+        with self._lock:
+            entry = self._projects.get(project_id)
+            if entry and entry["fingerprint"] == fingerprint:
+                for cached_embedding, answer in entry["scopes"].get(scope, []):
+                    score = _cosine(embedding, cached_embedding)
+                    if score >= best_score:
+                        best, best_score = answer, score
+            if best is None:
+                type(self).misses += 1
+            else:
+                type(self).hits += 1
+        return best
+
+    def store(
+        self,
+        project_id: int,
+        fingerprint: str,
+        scope: Hashable,
+        embedding: List[float],
+        answer: dict,
+    ):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._projects.get(project_id)
+            if not entry or entry["fingerprint"] != fingerprint:
+                # The corpus changed: answers for the old version are stale
+                entry = {"fingerprint": fingerprint, "scopes": {}}
+                self._projects.set(project_id, entry)
+            answers = entry["scopes"].setdefault(scope, [])
+            answers.append((embedding, answer))
+            del answers[:-settings.ANSWER_CACHE_ENTRIES_PER_SCOPE]
+
+    def invalidate(self, project_id: int):
+        with self._lock:
+            self._projects.pop(project_id)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "projects": len(self._projects),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "similarity_threshold": settings.ANSWER_CACHE_SIMILARITY,
+        }
+
+answer_cache = AnswerCache()
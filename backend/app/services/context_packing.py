@@ -0,0 +1,210 @@
+import logging
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from backend.app.core.config import settings
+from backend.app.services.ingestion import CHUNK_OVERLAP
+
+logger = logging.getLogger(__name__)
+
+# Shortest shared span treated as chunk overlap rather than coincidence
+_MIN_OVERLAP = 32
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / settings.CONTEXT_CHARS_PER_TOKEN)
+
+def _overlap(left: str, right: str, limit: int) -> int:
+    """
+    Length of the longest suffix of `left` (at most `limit` chars) that `right` starts with.
+    """
+    probe = right[:_MIN_OVERLAP]
+    if len(probe) < _MIN_OVERLAP:
+        return 0
+    i = left.find(probe, max(0, len(left) - limit))
+    while i != -1:
+        if right.startswith(left[i:]):
+            return len(left) - i
+        i = left.find(probe, i + 1)
+    return 0
+
+@dataclass
+class _Segment:
+    text: str
+    rank: int # Best (lowest) retrieval rank among the chunks merged into it
+    sources: List[Tuple[int, str]] = field(default_factory=list) # (rank, text) of those chunks
+
+    @property
+    def chunks(self) -> int:
+        return len(self.sources)
+
+def _chunk_segments(sources: List[Tuple[int, str]]) -> List[_Segment]:
+    return [_Segment(text, rank, [(rank, text)]) for rank, text in sources]
+
+def _merge_segments(segments: List[_Segment], limit: int) -> List[_Segment]:
+    """
+    Joins segments whose ends overlap (neighbouring chunks of one page) and drops
+    segments contained in another, until nothing changes.
+    """
+    merged = True
+    while merged:
+        merged = False
+        for i, a in enumerate(segments):
+            for j, b in enumerate(segments):
+                if i == j:
+                    continue
+                if b.text in a.text:
+                    a.rank, a.sources = min(a.rank, b.rank), a.sources + b.sources
+                elif overlap := _overlap(a.text, b.text, limit):
+                    a.text += b.text[overlap:]
+                    a.rank, a.sources = min(a.rank, b.rank), a.sources + b.sources
+                else:
+                    continue
+                del segments[j]
+                merged = True
+                break
+            if merged:
+                break
+    return segments
+
+def _cost(segments: List[_Segment], separator_tokens: int) -> int:
+    return sum(estimate_tokens(segment.text) for segment in segments) + separator_tokens * (len(segments) - 1)
+
+def _fit(segment: _Segment, budget: int, separator_tokens: int, limit: int) -> List[_Segment]:
+    """
+    The segment if it fits in `budget` tokens; otherwise as many of its chunks as fit,
+    best-ranked first (adjacent ones still merged), so a merged page too big for the
+    remaining budget still contributes its top evidence.
+    """
+    if estimate_tokens(segment.text) <= budget:
+        return [segment]
+    picked: List[Tuple[int, str]] = []
+    fitted: List[_Segment] = []
+    for source in sorted(segment.sources):
+        candidate = _merge_segments(_chunk_segments(picked + [source]), limit)
+        if _cost(candidate, separator_tokens) <= budget:
+            picked.append(source)
+            fitted = candidate
+    return sorted(fitted, key=lambda s: s.rank)
+
+@dataclass
+class PackedContext:
+    text: str
+    chunks_in: int
+    chunks_used: int
+    tokens_in: int # Estimated tokens of the naively joined chunks
+    tokens_out: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+def chat_header(meta: dict) -> str:
+    return f"[Document: {meta.get('source', 'Unknown')} | Page: {meta.get('page', '?')}]\n"
+
+def pack_context(
+    docs: List[dict],
+    token_budget: int,
+    header: Optional[Callable[[dict], str]] = None,
+    separator: str = "\n\n",
+) -> PackedContext:
+    """
+    Turns ranked retrieval results into prompt context:
+    chunks of the same document page are merged (their overlapping spans kept once),
+    then pages are added best-ranked first while they fit in `token_budget` (a merged
+    excerpt that doesn't fit is replaced by those of its chunks that do).
+    `header(metadata)` prefixes each page block, e.g. with its source and page number.
+    """
+    naive = separator.join((header(doc.get("metadata", {})) if header else "") + doc.get("content", "") for doc in docs)
+
+    groups: Dict[Hashable, List[_Segment]] = {}
+    metadata: Dict[Hashable, dict] = {}
+    for rank, doc in enumerate(docs):
+        meta = doc.get("metadata", {})
+        key = (meta.get("document_id", meta.get("source")), meta.get("page"))
+        groups.setdefault(key, []).extend(_chunk_segments([(rank, doc.get("content", ""))]))
+        metadata.setdefault(key, meta)
+
+    # One block per page; several non-adjacent excerpts of a page share its header
+    blocks = []
+    limit = CHUNK_OVERLAP * 2
+    for key, segments in groups.items():
+        segments = sorted(_merge_segments(segments, limit), key=lambda s: s.rank)
+        prefix = header(metadata[key]) if header else ""
+        blocks.append((min(s.rank for s in segments), prefix, segments))
+    blocks.sort(key=lambda block: block[0])
+
+    # Greedy fill by relevance: skip what doesn't fit, smaller pieces further down may still fit
+    parts = []
+    used_tokens = 0
+    chunks_used = 0
+    separator_tokens = estimate_tokens(separator)
+    for _, prefix, segments in blocks:
+        texts = []
+        cost = estimate_tokens(prefix) + (separator_tokens if parts else 0)
+        for segment in segments:
+            leading = separator_tokens if texts else 0
+            pieces = _fit(segment, token_budget - used_tokens - cost - leading, separator_tokens, limit)
+            if not pieces:
+                continue
+            texts.extend(piece.text for piece in pieces)
+            cost += leading + _cost(pieces, separator_tokens)
+            chunks_used += sum(piece.chunks for piece in pieces)
+        if texts:
+            parts.append(prefix + "\n...\n".join(texts))
+            used_tokens += cost
+
+    if not parts and docs:
+        # Even the best chunk alone is over budget: send as much of it as fits
+        meta = docs[0].get("metadata", {})
+        prefix = header(meta) if header else ""
+        max_chars = int((token_budget - estimate_tokens(prefix)) * settings.CONTEXT_CHARS_PER_TOKEN)
+        if max_chars > 0:
+            parts.append(prefix + docs[0].get("content", "")[:max_chars])
+            chunks_used = 1
+
+    text = separator.join(parts)
+    return PackedContext(
+        text=text,
+        chunks_in=len(docs),
+        chunks_used=chunks_used,
+        tokens_in=estimate_tokens(naive),
+        tokens_out=estimate_tokens(text),
+    )
+
+class ContextPackingStats:
+    """
+    Running totals of the context tokens sent to the LLM, for /admin/metrics.
+    """
+    _instance = None
+    _lock: threading.Lock = None
+    requests = 0
+    tokens_in = 0
+    tokens_out = 0
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ContextPackingStats, cls).__new__(cls)
+            cls._lock = threading.Lock()
+        return cls._instance
+
+    def record(self, label: str, packed: PackedContext):
+        with self._lock:
+            type(self).requests += 1
+            type(self).tokens_in += packed.tokens_in
+            type(self).tokens_out += packed.tokens_out
+        logger.info(
+            f"{label} context: {packed.chunks_used}/{packed.chunks_in} chunks, "
+            f"~{packed.tokens_out} tokens ({packed.tokens_saved} saved)"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "tokens_saved": self.tokens_in - self.tokens_out,
+            "avg_tokens_saved": (self.tokens_in - self.tokens_out) / self.requests if self.requests else 0.0,
+        }
+
+context_stats = ContextPackingStats()
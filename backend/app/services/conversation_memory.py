@@ -0,0 +1,118 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Set, Tuple
+from sqlalchemy.orm import Session
+from backend.app.core.config import settings
+from backend.app.models import ChatMessage, ChatRole, ConversationMemory
+from backend.app.models.project import MessageType
+
+logger = logging.getLogger(__name__)
+
+def _clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit].rstrip() + " [...]"
+
+def _format(messages: List[ChatMessage], limit: int) -> str:
+    text = ""
+    for msg in messages:
+        role_label = "User" if msg.role == ChatRole.USER else "Assistant"
+        text += f"{role_label}: {_clip(msg.content, limit)}\n\n"
+    return text
+
+class ConversationMemoryService:
+    """
+    Bounded chat history for the prompts: a persisted rolling summary of a conversation
+    (per project and message type) plus its last few messages verbatim.
+    Messages that fall out of the recent window are folded into the summary on a
+    background worker after each exchange, so no request waits for summarization.
+    """
+    _instance = None
+    _executor: ThreadPoolExecutor = None
+    _pending: Set[Tuple[int, MessageType]] = None
+    _lock: threading.Lock = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ConversationMemoryService, cls).__new__(cls)
+            # One worker: updates of a conversation never race each other
+            cls._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-memory")
+            cls._pending = set()
+            cls._lock = threading.Lock()
+        return cls._instance
+
+    def _memory(self, db: Session, project_id: int, message_type: MessageType) -> ConversationMemory:
+        return db.query(ConversationMemory).filter(
+            ConversationMemory.project_id == project_id,
+            ConversationMemory.message_type == message_type
+        ).first()
+
+    def history(self, db: Session, project_id: int, message_type: MessageType) -> str:
+        """
+        Chat history text for the prompt: the summary of older messages, then the
+        most recent messages of the same mode (chat vs research).
+        """
+        memory = self._memory(db, project_id, message_type)
+        summarized_until_id = memory.summarized_until_id if memory else 0
+
+        recent = db.query(ChatMessage).filter(
+            ChatMessage.project_id == project_id,
+            ChatMessage.message_type == message_type,
+            ChatMessage.id > summarized_until_id
+        ).order_by(ChatMessage.id.desc()).limit(settings.MEMORY_RECENT_MESSAGES).all()
+        recent.reverse() # Chronological order
+
+        history = ""
+        if memory and memory.summary:
+            history += f"Summary of the earlier conversation:\n{memory.summary}\n\n"
+        return history + _format(recent, settings.MEMORY_MESSAGE_MAX_CHARS)
+
+    def schedule_update(self, project_id: int, message_type: MessageType):
+        """
+        Queues folding of messages older than the recent window into the summary.
+        """
+        key = (project_id, message_type)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._update, project_id, message_type)
+
+    def _update(self, project_id: int, message_type: MessageType):
+        from backend.app.db.base import SessionLocal
+        from backend.app.services.reasoning import reasoning_service
+
+        with self._lock:
+            self._pending.discard((project_id, message_type))
+
+        db = SessionLocal()
+        try:
+            memory = self._memory(db, project_id, message_type)
+            if memory is None:
+                memory = ConversationMemory(project_id=project_id, message_type=message_type, summary="", summarized_until_id=0)
+                db.add(memory)
+
+            while True:
+                unsummarized = db.query(ChatMessage).filter(
+                    ChatMessage.project_id == project_id,
+                    ChatMessage.message_type == message_type,
+                    ChatMessage.id > memory.summarized_until_id
+                ).order_by(ChatMessage.id.asc()).all()
+                # Everything except the recent window, oldest first, a batch at a time
+                to_fold = unsummarized[:-settings.MEMORY_RECENT_MESSAGES or None][:settings.MEMORY_SUMMARY_BATCH]
+                if not to_fold:
+                    break
+
+                # Research reports are long: the summarizer sees a larger cut than the prompt window
+                transcript = _format(to_fold, settings.MEMORY_MESSAGE_MAX_CHARS * 4)
+                memory.summary = reasoning_service.summarize_conversation(memory.summary, transcript)
+                memory.summarized_until_id = to_fold[-1].id
+                db.commit()
+                logger.info(f"Folded {len(to_fold)} {message_type.value} messages of project {project_id} into memory")
+        except Exception as e:
+            db.rollback()
+            # The messages stay unsummarized and are retried after the next exchange
+            logger.error(f"Conversation memory update failed for project {project_id}: {e}")
+        finally:
+            db.close()
+
+conversation_memory = ConversationMemoryService()
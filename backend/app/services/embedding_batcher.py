@@ -0,0 +1,132 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _EmbeddingRequest:
+    texts: List[str]
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Coalesces embedding calls from concurrent callers into batched forward passes.
+
+    Requests are queued and a single dispatcher thread waits up to `max_wait_ms` after
+    the first one for more to arrive (or until `max_batch_size` texts are pending), then
+    embeds them all in one `embed_documents` call on the wrapped model.
+    Queries go through the same path, which is fine for symmetric models like MiniLM
+    where a query embedding is just a one-text document embedding.
+    """
+
+    def __init__(self, inner: Embeddings, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.inner = inner
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[_EmbeddingRequest]" = queue.Queue()
+        self._carry: List[_EmbeddingRequest] = []
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._items = 0
+        self._queue_wait = 0.0
+        self._forward_time = 0.0
+        self._dispatcher = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._dispatcher.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Split large calls so one bulk ingestion can't monopolise a batch
+        requests = [
+            self._submit(texts[i:i + self.max_batch_size])
+            for i in range(0, len(texts), self.max_batch_size)
+        ]
+        vectors = []
+        for request in requests:
+            vectors.extend(request.future.result())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text]).future.result()[0]
+
+    def _submit(self, texts: List[str]) -> _EmbeddingRequest:
+        request = _EmbeddingRequest(texts=list(texts))
+        self._queue.put(request)
+        return request
+
+    def _next_request(self, timeout: float = None) -> _EmbeddingRequest:
+        if self._carry:
+            return self._carry.pop()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self) -> List[_EmbeddingRequest]:
+        batch = [self._next_request()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._next_request(timeout=timeout)
+            except queue.Empty:
+                break
+            if size + len(request.texts) > self.max_batch_size:
+                # Doesn't fit: it opens the next batch instead
+                self._carry.append(request)
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+            started = time.monotonic()
+            try:
+                vectors = self.inner.embed_documents(texts)
+            except Exception as e:
+                logger.error(f"Batched embedding of {len(texts)} texts failed: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finished = time.monotonic()
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._requests += len(batch)
+                self._items += len(texts)
+                self._queue_wait += sum(started - request.enqueued_at for request in batch)
+                self._forward_time += finished - started
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                "batches": self._batches,
+                "requests": self._requests,
+                "items": self._items,
+                "avg_batch_size": self._items / batches,
+                "avg_batch_fill": self._items / (batches * self.max_batch_size),
+                "avg_requests_per_batch": self._requests / batches,
+                "avg_queue_wait_ms": 1000 * self._queue_wait / requests,
+                "avg_forward_ms": 1000 * self._forward_time / batches,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queued": self._queue.qsize(),
+            }
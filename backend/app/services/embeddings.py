@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+from langchain_core.embeddings import Embeddings
+from backend.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def _normalizer_lowercases(normalizer: Optional[dict]) -> bool:
+    """
+    Whether a serialized `tokenizers` normalizer (tokenizer.json) lowercases its input.
+    """
+    if not normalizer:
+        return False
+    if normalizer.get("type") == "Lowercase" or normalizer.get("lowercase"):
+        return True
+    return any(_normalizer_lowercases(n) for n in normalizer.get("normalizers") or [])
+
+def tokenizer_lowercases(model: Embeddings) -> bool:
+    """
+    Whether a loaded embedding model lowercases its input, i.e. texts that differ only in
+    case get the same embedding. Read from the model's tokenizer config; unknown is cased.
+    """
+    model = getattr(model, "inner", model) # Unwrap BatchingEmbeddings
+    if isinstance(model, OnnxEmbeddings):
+        return model.lowercases
+    client = getattr(model, "_client", None) # HuggingFaceEmbeddings' SentenceTransformer
+    if client is None:
+        return False
+    try:
+        if getattr(client._first_module(), "do_lower_case", False):
+            return True # sentence-transformers lowercases before tokenizing
+        tokenizer = client.tokenizer
+        backend_tokenizer = getattr(tokenizer, "backend_tokenizer", None)
+        if backend_tokenizer is not None:
+            return _normalizer_lowercases(json.loads(backend_tokenizer.to_str()).get("normalizer"))
+        return bool(getattr(tokenizer, "do_lower_case", False))
+    except Exception as e:
+        logger.warning(f"Could not read the embedding tokenizer config, treating the model as cased: {e}")
+        return False
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings from an exported (optionally int8-quantized) ONNX transformer on CPU.
+    Reproduces the sentence-transformers MiniLM pipeline: tokenize, encode,
+    mean-pool over the attention mask, L2-normalize.
+    `model_dir` must contain the .onnx file and the tokenizer.json saved next to it
+    (see export_onnx_model.py).
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        model_file: str = "model_quantized.onnx",
+        max_length: int = 256,
+        batch_size: int = 32,
+        num_threads: int = 0,
+    ):
+        try:
+            import numpy as np
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=onnx requires the onnxruntime and tokenizers packages") from e
+
+        self._np = np
+        self.batch_size = batch_size
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.lowercases = _normalizer_lowercases(json.loads(self._tokenizer.to_str()).get("normalizer"))
+        self._tokenizer.enable_truncation(max_length=max_length)
+        self._tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        np = self._np
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self._session.run(None, feeds)[0]
+
+        mask = attention_mask[..., None].astype(token_embeddings.dtype)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed(texts[i:i + self.batch_size]))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+class LazyEmbeddings(Embeddings):
+    """
+    Defers building the model until the first embedding call, or until warm_up() loads it
+    in the background, so importing the service doesn't pay for loading model weights.
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings]):
+        self._factory = factory
+        self._model: Optional[Embeddings] = None
+        self._lowercases = False
+        self._lock = threading.Lock()
+        self.error: Optional[str] = None
+
+    @property
+    def loaded_model(self) -> Optional[Embeddings]:
+        return self._model
+
+    @property
+    def is_ready(self) -> bool:
+        return self._model is not None
+
+    @property
+    def lowercases(self) -> bool:
+        """
+        tokenizer_lowercases() of the loaded model (False until it is loaded), unless
+        EMBEDDING_LOWERCASE overrides it.
+        """
+        if settings.EMBEDDING_LOWERCASE is not None:
+            return settings.EMBEDDING_LOWERCASE
+        return self._lowercases
+
+    def _get_model(self) -> Embeddings:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    try:
+                        model = self._factory()
+                        self._lowercases = tokenizer_lowercases(model)
+                        self._model = model
+                    except Exception as e:
+                        self.error = str(e)
+                        logger.error(f"Failed to load embedding model: {e}")
+                        raise
+                    self.error = None
+                    logger.info(f"Embedding model loaded in {time.perf_counter() - started:.1f}s")
+        return self._model
+
+    def warm_up(self) -> threading.Thread:
+        """
+        Loads the model on a background thread; callers that need it sooner simply block on the lock.
+        """
+        def load():
+            try:
+                self._get_model()
+            except Exception:
+                pass # Recorded in self.error; the next call retries
+
+        thread = threading.Thread(target=load, name="embedding-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._get_model().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._get_model().embed_query(text)
+
+def embedding_model_id(backend: Optional[str] = None) -> str:
+    """
+    Identifies the model producing the vectors (used in cache keys).
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "onnx":
+        return f"onnx:{settings.ONNX_MODEL_PATH}/{settings.ONNX_MODEL_FILE}"
+    return settings.EMBEDDING_MODEL
+
+def build_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """
+    Creates the embedding model selected by EMBEDDING_BACKEND ("huggingface" or "onnx").
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "onnx":
+        if not settings.ONNX_MODEL_PATH:
+            raise ValueError("EMBEDDING_BACKEND=onnx requires ONNX_MODEL_PATH")
+        logger.info(f"Loading ONNX embedding model from {settings.ONNX_MODEL_PATH}...")
+        return OnnxEmbeddings(
+            settings.ONNX_MODEL_PATH,
+            model_file=settings.ONNX_MODEL_FILE,
+            num_threads=settings.ONNX_NUM_THREADS
+        )
+    if backend == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        logger.info(f"Loading HuggingFace embedding model {settings.EMBEDDING_MODEL}...")
+        return HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
@@ -1,10 +1,25 @@
+import hashlib
+import io
 import logging
+import mmap
+import multiprocessing
 import os
+import queue
 import re
-from tempfile import NamedTemporaryFile
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, Union
+import aiofiles
 from fastapi import UploadFile
 from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from backend.app.core.config import settings
+from backend.app.services import page_cache
 
 logger = logging.getLogger(__name__)
 
@@ -24,41 +39,516 @@ def clean_text(text: str) -> str:
     text = re.sub(r'[ \t]+', ' ', text)
     return text.strip()
 
-def extract_text_from_bytes_and_chunk(file_stream, filename: str) -> list[dict]:
+# Single-pass equivalent of the three substitutions in clean_text().
+# Groups: 1 = hyphenated line break, 2 = blank lines, 3 = runs of spaces/tabs.
+# Single spaces are left alone so the common case costs no replacement at all.
+# Every alternative starts with a literal so most positions are rejected on the first character.
+_CLEAN_PATTERN = re.compile(r'(-(?<=\w-)\s+(?=\w))|(\n\n+)|(  [ \t]*|\t[ \t]*| \t[ \t]*)')
+_CLEAN_REPLACEMENTS = (None, '', '\n', ' ')
+_WORD = re.compile(r'\w+')
+
+# Break points in order of preference, coarsest first (mirrors the recursive splitter).
+_SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+def clean_text_fast(text: str) -> str:
     """
-    Extracts text from a file-like object (bytes), chunks it, and returns list of docs with metadata.
+    Same cleaning as clean_text(), done in one regex pass over the page.
+    Like clean_text(), a word that ended a hyphenation join is not joined again to the
+    next line ("a-\\na-\\na" -> "aa-\\na").
     """
-    chunks_with_metadata = []
-    try:
-        reader = PdfReader(file_stream)
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            separators=["\n\n", "\n", ". ", " ", ""]
+    joined_until = None # Where the word after the last joined line break starts
+
+    def replace(m: re.Match) -> str:
+        nonlocal joined_until
+        if m.lastindex != 1:
+            return _CLEAN_REPLACEMENTS[m.lastindex]
+        if joined_until is not None and _WORD.fullmatch(text, joined_until, m.start()):
+            # clean_text() consumed this word in the previous join: the break stays, cleaned
+            whitespace = re.sub(r'\n{2,}', '\n', m.group(1)[1:])
+            return "-" + re.sub(r'[ \t]+', ' ', whitespace)
+        joined_until = m.end()
+        return ''
+
+    return _CLEAN_PATTERN.sub(replace, text).strip()
+
+def _next_whitespace(text: str, start: int, end: int) -> int:
+    positions = [pos for pos in (text.find(" ", start, end), text.find("\n", start, end)) if pos != -1]
+    return min(positions) if positions else -1
+
+def chunk_spans(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> list[tuple[int, int]]:
+    """
+    Splits text into (start, end) offsets without copying substrings.
+    Chunks are at most `chunk_size` characters, end on the coarsest separator found in the
+    back half of the window, and start roughly `chunk_overlap` characters before the previous
+    chunk ended (aligned to a word boundary).
+    """
+    spans = []
+    length = len(text)
+    start = 0
+    while start < length:
+        while start < length and text[start].isspace():
+            start += 1
+        if start >= length:
+            break
+
+        end = start + chunk_size
+        if end >= length:
+            end = length
+        else:
+            min_end = start + chunk_size // 2
+            for separator in _SEPARATORS:
+                pos = text.rfind(separator, min_end, end)
+                if pos != -1:
+                    # Keep the full stop with its sentence
+                    end = pos + 1 if separator == ". " else pos
+                    break
+
+        stop = end
+        while stop > start and text[stop - 1].isspace():
+            stop -= 1
+        spans.append((start, stop))
+        if end >= length:
+            break
+
+        next_start = end - chunk_overlap
+        if next_start <= start:
+            next_start = end
+        else:
+            boundary = _next_whitespace(text, next_start, end)
+            if boundary != -1:
+                next_start = boundary + 1
+        start = next_start
+    return spans
+
+def chunker_config() -> str:
+    """
+    Identifies the chunking that produces a document's chunks (recorded per document).
+    """
+    return f"{settings.INGESTION_CHUNKER}:{CHUNK_SIZE}:{CHUNK_OVERLAP}"
+
+def _split_page(splitter: Optional[RecursiveCharacterTextSplitter], page_text: str) -> list[str]:
+    """
+    Splits one cleaned page with the configured chunker.
+    """
+    if splitter is None:
+        return [page_text[start:end] for start, end in chunk_spans(page_text)]
+    return splitter.split_text(page_text) if page_text else []
+
+def _get_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+
+def _iter_clean_pages(reader: PdfReader, start: int, end: int) -> Iterator[tuple[int, str]]:
+    """
+    Extracts and cleans pages [start, end) of an open reader, one page at a time.
+    Yields (page_number, text), including empty pages so callers can track progress.
+    """
+    for i in range(start, end):
+        yield i + 1, clean_text_fast(reader.pages[i].extract_text())
+
+def _extract_page_range(source: Union[bytes, str], start: int, end: int) -> list[tuple[int, str]]:
+    """
+    Process pool entry point: each worker parses its own reader over the raw bytes,
+    or memory-maps the file when given a path (so the bytes never cross the process boundary).
+    Must stay a module-level function so it can be pickled.
+    """
+    with _open_source(source) as stream:
+        return list(_iter_clean_pages(PdfReader(stream), start, end))
+
+@contextmanager
+def _open_source(source: Union[bytes, str]):
+    """
+    Read-only stream over in-memory bytes or a memory-mapped file.
+    """
+    if isinstance(source, bytes) or os.path.getsize(source) == 0:
+        yield io.BytesIO(source if isinstance(source, bytes) else b"")
+        return
+    with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Created lazily so each server process owns its own pool (safe with forking workers).
+    # Spawned, not forked: this process already runs threads (job queue, embedding batcher,
+    # memory summarizer) and OpenMP, whose locks a forked child could inherit held.
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.INGESTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
         )
+    return _pool
 
-        for i, page in enumerate(reader.pages):
-            page_text = clean_text(page.extract_text())
-            if not page_text:
-                continue
-            
-            # Split this page's text
-            page_chunks = splitter.split_text(page_text)
-            
-            for chunk in page_chunks:
-                chunks_with_metadata.append({
-                    "text": chunk,
-                    "metadata": {
-                        "source": filename,
-                        "page": i + 1
-                    }
-                })
-                
-        return chunks_with_metadata
+def _page_ranges(page_count: int, workers: int) -> list[tuple[int, int]]:
+    """
+    Splits pages into contiguous ranges, a few per worker so a slow range doesn't stall the pool.
+    """
+    range_size = max(1, -(-page_count // (workers * 4)))
+    return [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+
+@dataclass
+class IngestionProgress:
+    """
+    Counters updated while a document flows through the pipeline.
+    """
+    total_pages: int = 0
+    pages_processed: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    chunks_deleted: int = 0
+    chunks_relocated: int = 0 # Reused chunks whose page number changed
+    failed_batches: int = 0
+
+def chunk_fingerprint(text: str) -> str:
+    """
+    Stable identity of a chunk: the same text always maps to the same hash, on whatever page,
+    so inserting or removing a page does not invalidate the chunks after it.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def iter_pages(
+    file_stream,
+    workers: Optional[int] = None,
+    progress: Optional[IngestionProgress] = None,
+    source_path: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> Iterator[tuple[int, str]]:
+    """
+    Lazily yields (page_number, cleaned_text) in page order.
+    Pages of a file already in the page cache (by `content_hash`, or an open entry passed as
+    `file_stream`) are read from there without touching the PDF; otherwise they are extracted and written to the cache on the way through.
+    Large documents are split into page ranges and extracted across a process pool,
+    with only a bounded number of ranges in flight at once.
+    `source_path` is an on-disk copy of the stream; pool workers map it instead of receiving bytes.
+    """
+    workers = settings.INGESTION_WORKERS if workers is None else workers
+    progress = progress or IngestionProgress()
+
+    if isinstance(file_stream, page_cache.CachedPages):
+        # Entry opened by the caller, which also closes it
+        cached, owned = file_stream, False
+    else:
+        cached, owned = page_cache.get(content_hash), True
+    if cached:
+        try:
+            progress.total_pages = len(cached)
+            for i, text in enumerate(cached):
+                progress.pages_processed += 1
+                yield i + 1, text
+        finally:
+            if owned:
+                cached.close()
+        return
+
+    if file_stream is None:
+        raise ValueError("No file to read and no page cache entry for it")
+    reader = PdfReader(file_stream)
+    page_count = len(reader.pages)
+    progress.total_pages = page_count
+    cache_writer = page_cache.writer(content_hash, page_count)
+
+    try:
+        for page_number, text in _extract_pages(reader, file_stream, page_count, workers, source_path):
+            if cache_writer:
+                cache_writer.add(text)
+            progress.pages_processed += 1
+            yield page_number, text
+    except BaseException:
+        # Includes GeneratorExit: an abandoned extraction must not leave a partial entry
+        if cache_writer:
+            cache_writer.abort()
+        raise
+
+    if cache_writer:
+        cache_writer.commit()
+
+def _extract_pages(reader: PdfReader, file_stream, page_count: int, workers: int, source_path: Optional[str]) -> Iterator[tuple[int, str]]:
+    if workers <= 1 or page_count < settings.INGESTION_PARALLEL_MIN_PAGES:
+        yield from _iter_clean_pages(reader, 0, page_count)
+        return
+
+    if source_path:
+        source = source_path
+    else:
+        file_stream.seek(0)
+        source = file_stream.read()
+    ranges = _page_ranges(page_count, workers)
+    logger.info(f"Extracting {page_count} pages in {len(ranges)} ranges across {workers} workers")
+
+    # Futures are consumed in submission order, which keeps pages in order.
+    pool = _get_pool()
+    pending = deque()
+    for start, end in ranges:
+        pending.append(pool.submit(_extract_page_range, source, start, end))
+        if len(pending) >= workers * 2:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+def iter_chunks(
+    file_stream,
+    filename: str,
+    workers: Optional[int] = None,
+    progress: Optional[IngestionProgress] = None,
+    source_path: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> Iterator[dict]:
+    """
+    Lazily yields {text, metadata} chunks in page order (see iter_pages).
+    """
+    splitter = None if settings.INGESTION_CHUNKER == "native" else _get_splitter()
+    for page_number, page_text in iter_pages(file_stream, workers, progress, source_path, content_hash):
+        # Split this page's text
+        for chunk in _split_page(splitter, page_text):
+            yield {
+                "text": chunk,
+                "metadata": {
+                    "source": filename,
+                    "page": page_number
+                }
+            }
+
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Groups an iterable into lists of at most `size` items.
+    """
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def extract_text_from_bytes_and_chunk(file_stream, filename: str, workers: Optional[int] = None) -> list[dict]:
+    """
+    Extracts text from a file-like object (bytes), chunks it, and returns list of docs with metadata.
+    """
+    try:
+        return list(iter_chunks(file_stream, filename, workers=workers))
     except Exception as e:
         logger.error(f"Error reading PDF stream: {e}")
         raise ValueError("Failed to extract text from PDF stream")
 
+_DONE = object()
+
+def index_document(
+    file_stream,
+    filename: str,
+    project_id: int,
+    document_id: int,
+    progress: Optional[IngestionProgress] = None,
+    batch_size: Optional[int] = None,
+    skip_chunk: Optional[Callable[[dict], bool]] = None,
+    source_path: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> IngestionProgress:
+    """
+    Streams a PDF through extract -> chunk -> embed -> upsert in bounded batches.
+    Parsing runs on a producer thread so embedding of one batch overlaps with parsing the next;
+    the queue depth caps how many batches are held in memory at once.
+    Chunks for which `skip_chunk` returns True are already stored and are not embedded again;
+    if it also set chunk["refresh_id"], that vector row's metadata is updated (e.g. a new page number).
+    Every chunk, stored or not, is also added to the project's sparse (BM25) index.
+    """
+    from backend.app.services.rag import rag_service # Local import: keep the model out of pool workers
+    from backend.app.services.sparse_index import sparse_index
+
+    batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+    progress = progress or IngestionProgress()
+    batches: queue.Queue = queue.Queue(maxsize=settings.INGESTION_QUEUE_DEPTH)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Gives up once the consumer has stopped, so the producer never blocks forever.
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fingerprinted_chunks() -> Iterator[dict]:
+        for chunk in iter_chunks(file_stream, filename, progress=progress, source_path=source_path, content_hash=content_hash):
+            meta = chunk["metadata"]
+            meta["chunk_hash"] = chunk_fingerprint(chunk["text"])
+            chunk["stored"] = bool(skip_chunk and skip_chunk(chunk))
+            if chunk["stored"]:
+                progress.chunks_reused += 1
+            yield chunk
+
+    def produce():
+        try:
+            for batch in iter_batches(fingerprinted_chunks(), batch_size):
+                if not put(batch):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, name=f"ingest-{document_id}", daemon=True)
+    producer.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                break
+            if isinstance(batch, Exception):
+                logger.error(f"Error reading PDF stream: {batch}")
+                raise ValueError("Failed to extract text from PDF stream") from batch
+
+            for c in batch:
+                meta = c["metadata"]
+                meta["document_id"] = document_id # Add DB ID to metadata
+                meta["source"] = filename # Ensure source is friendly name
+                meta["project_id"] = project_id
+
+            sparse_index.add(project_id, [c["text"] for c in batch], [c["metadata"] for c in batch])
+
+            refresh = {c["refresh_id"]: c["metadata"] for c in batch if c["stored"] and c.get("refresh_id")}
+            if refresh:
+                progress.chunks_relocated += rag_service.update_chunk_metadata(project_id, refresh)
+
+            pending = [c for c in batch if not c["stored"]]
+            if not pending:
+                continue
+            if rag_service.add_documents(project_id, [c["text"] for c in pending], [c["metadata"] for c in pending]):
+                progress.chunks_embedded += len(pending)
+            else:
+                progress.failed_batches += 1
+    finally:
+        stop.set()
+        producer.join()
+
+    rag_service.flush_vectors(project_id)
+    return progress
+
+def reindex_document(
+    file_stream,
+    filename: str,
+    project_id: int,
+    document_id: int,
+    progress: Optional[IngestionProgress] = None,
+    source_path: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    full: bool = False,
+) -> IngestionProgress:
+    """
+    Re-indexes a revised version of an already indexed document.
+    Chunks whose fingerprint is already stored keep their vectors (only their page metadata is
+    updated if they moved), new or changed chunks are embedded and upserted, and vectors of
+    chunks that disappeared are deleted afterwards (so the document stays searchable throughout).
+    With `full`, every chunk is embedded again (e.g. after switching embedding models).
+    """
+    from backend.app.services.rag import rag_service
+    from backend.app.services.sparse_index import sparse_index
+
+    progress = progress or IngestionProgress()
+    # chunk_hash -> (vector id, page) of rows still waiting to be matched by the new version
+    stored = rag_service.get_chunk_fingerprints(project_id, document_id)
+
+    def is_stored(chunk: dict) -> bool:
+        if full:
+            return False
+        meta = chunk["metadata"]
+        rows = stored.get(meta["chunk_hash"])
+        if not rows:
+            return False
+        vector_id, page = rows.pop()
+        if page != meta["page"]:
+            chunk["refresh_id"] = vector_id
+        return True
+
+    # The sparse entries are cheap to rebuild: index_document re-adds every chunk
+    sparse_index.delete_document(project_id, document_id)
+    index_document(
+        file_stream, filename, project_id, document_id,
+        progress=progress, skip_chunk=is_stored, source_path=source_path, content_hash=content_hash
+    )
+
+    if progress.failed_batches:
+        # Keep the old vectors: deleting now could leave the document with gaps.
+        return progress
+
+    stale_ids = [vector_id for rows in stored.values() for vector_id, _ in rows]
+    if stale_ids:
+        progress.chunks_deleted = rag_service.delete_vectors(project_id, stale_ids)
+    logger.info(
+        f"Re-indexed {filename}: {progress.chunks_embedded} embedded, "
+        f"{progress.chunks_reused} reused ({progress.chunks_relocated} moved), {progress.chunks_deleted} deleted"
+    )
+    return progress
+
+class UploadTooLarge(ValueError):
+    pass
+
+@dataclass
+class SpooledUpload:
+    """
+    An uploaded file held in memory when small, or spooled to a temp file above
+    UPLOAD_SPOOL_THRESHOLD. Exactly one of `data` / `path` is set.
+    """
+    size: int
+    content_hash: str
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+
+    @contextmanager
+    def open(self):
+        """
+        Read-only stream over the upload (memory-mapped when spooled to disk).
+        """
+        with _open_source(self.path or self.data) as stream:
+            yield stream
+
+    def cleanup(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.data = None
+
+async def spool_upload(file: UploadFile, max_size: Optional[int] = None) -> SpooledUpload:
+    """
+    Reads an upload in UPLOAD_CHUNK_SIZE pieces, hashing as it goes. Small files stay in memory,
+    larger ones are written to a temp file so only one chunk is resident at a time.
+    Raises UploadTooLarge once more than `max_size` bytes have been received.
+    """
+    max_size = max_size or settings.MAX_UPLOAD_SIZE
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    path = None
+    spool = None
+    size = 0
+    try:
+        while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLarge(f"{file.filename} exceeds the {max_size // (1024 * 1024)} MB upload limit")
+            digest.update(chunk)
+
+            if spool is None and len(buffer) + len(chunk) <= settings.UPLOAD_SPOOL_THRESHOLD:
+                buffer.extend(chunk)
+                continue
+
+            if spool is None:
+                fd, path = tempfile.mkstemp(suffix=".pdf", prefix="upload_")
+                os.close(fd)
+                spool = await aiofiles.open(path, "wb")
+                await spool.write(bytes(buffer))
+                buffer = bytearray()
+            await spool.write(chunk)
+    except Exception:
+        if spool is not None:
+            await spool.close()
+        if path and os.path.exists(path):
+            os.remove(path)
+        raise
+
+    if spool is not None:
+        await spool.close()
+        return SpooledUpload(size=size, content_hash=digest.hexdigest(), path=path)
+    return SpooledUpload(size=size, content_hash=digest.hexdigest(), data=bytes(buffer))
+
 def extract_text_and_chunk(file_path: str, filename: str) -> list[dict]:
     """
     Wrapper for backward compatibility or file-path based processing.
@@ -73,7 +563,6 @@ async def process_pdf(file: UploadFile) -> list[dict]:
     contents = await file.read()
     
     # Use io.BytesIO to treat bytes as a file stream
-    import io
     file_stream = io.BytesIO(contents)
     
     try:
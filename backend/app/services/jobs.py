@@ -0,0 +1,87 @@
+import enum
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+from backend.app.core.config import settings
+from backend.app.services.ingestion import IngestionProgress
+
+logger = logging.getLogger(__name__)
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+@dataclass
+class IngestionJob:
+    project_id: int
+    document_id: int
+    filename: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.QUEUED
+    progress: IngestionProgress = field(default_factory=IngestionProgress)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+class JobQueue:
+    """
+    Local, in-process queue for ingestion work.
+    Jobs run on a bounded worker pool so a burst of uploads can't starve the API,
+    and their progress is kept in memory for polling.
+    """
+    _instance = None
+    _executor: ThreadPoolExecutor = None
+    _jobs: Dict[str, IngestionJob] = None
+    _lock: threading.Lock = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(JobQueue, cls).__new__(cls)
+            cls._executor = ThreadPoolExecutor(
+                max_workers=settings.INGESTION_QUEUE_WORKERS,
+                thread_name_prefix="ingestion-job"
+            )
+            cls._jobs = {}
+            cls._lock = threading.Lock()
+        return cls._instance
+
+    def submit(self, job: IngestionJob, target: Callable[[IngestionJob], None]) -> IngestionJob:
+        """
+        Registers the job and schedules `target(job)` on the worker pool.
+        """
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, target)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: IngestionJob, target: Callable[[IngestionJob], None]):
+        job.status = JobStatus.RUNNING
+        try:
+            target(job)
+            job.status = JobStatus.COMPLETED
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} for {job.filename} failed: {e}")
+            job.error = str(e)
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        # Forget finished jobs once clients have had time to see the final state.
+        cutoff = time.time() - settings.INGESTION_JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+job_queue = JobQueue()
@@ -0,0 +1,256 @@
+"""
+On-disk cache of cleaned per-page PDF text, keyed by the SHA-256 of the file.
+
+Each entry is a single memory-mappable file:
+
+    b"PGC1" | uint32 page_count | uint64 offsets[page_count + 1] | UTF-8 page text
+
+Offsets are relative to the start of the text block, so page i is
+data[offsets[i]:offsets[i + 1]] and can be decoded without reading the rest.
+
+CLI (run from the repository root):
+    python -m backend.app.services.page_cache warm paper.pdf [...]
+    python -m backend.app.services.page_cache warm --documents
+    python -m backend.app.services.page_cache prune [--max-bytes N]
+    python -m backend.app.services.page_cache stats
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Iterator, Optional
+from backend.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PGC1"
+HEADER = struct.Struct("<4sI")
+OFFSET = struct.Struct("<Q")
+SUFFIX = ".pages"
+
+_prune_lock = threading.Lock()
+
+def _entry_path(content_hash: str) -> str:
+    # Two-level fan-out keeps directories small
+    return os.path.join(settings.PAGE_CACHE_DIR, content_hash[:2], content_hash + SUFFIX)
+
+class CachedPages:
+    """
+    Read-only, memory-mapped view of one cache entry.
+    """
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a page cache entry: {path}")
+        self._data_start = HEADER.size + OFFSET.size * (self._count + 1)
+
+    def _offset(self, i: int) -> int:
+        return OFFSET.unpack_from(self._map, HEADER.size + OFFSET.size * i)[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        start = self._data_start + self._offset(i)
+        end = self._data_start + self._offset(i + 1)
+        return self._map[start:end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            yield self[i]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class PageCacheWriter:
+    """
+    Streams pages into a temp file as they are extracted; the entry only becomes
+    visible on commit(), so readers never see a partial document.
+    """
+    def __init__(self, content_hash: str, page_count: int):
+        self._path = _entry_path(content_hash)
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._path), suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        self._page_count = page_count
+        self._offsets = [0]
+        # Offsets are written last, once every page length is known
+        self._file.write(HEADER.pack(MAGIC, page_count))
+        self._file.write(b"\0" * OFFSET.size * (page_count + 1))
+
+    def add(self, text: str):
+        data = text.encode("utf-8")
+        self._file.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def commit(self):
+        if len(self._offsets) != self._page_count + 1:
+            self.abort()
+            raise ValueError(f"Expected {self._page_count} pages, got {len(self._offsets) - 1}")
+        self._file.seek(HEADER.size)
+        self._file.write(b"".join(OFFSET.pack(offset) for offset in self._offsets))
+        self._file.close()
+        os.replace(self._tmp_path, self._path)
+        prune()
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+def get(content_hash: Optional[str]) -> Optional[CachedPages]:
+    """
+    Opens the cached pages for a file hash, or returns None on a miss.
+    """
+    if not settings.PAGE_CACHE_ENABLED or not content_hash:
+        return None
+    path = _entry_path(content_hash)
+    try:
+        pages = CachedPages(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Dropping unreadable page cache entry {path}: {e}")
+        os.remove(path)
+        return None
+    # Mark as recently used for eviction
+    os.utime(path)
+    return pages
+
+def contains(content_hash: Optional[str]) -> bool:
+    return bool(settings.PAGE_CACHE_ENABLED and content_hash and os.path.exists(_entry_path(content_hash)))
+
+def writer(content_hash: Optional[str], page_count: int) -> Optional[PageCacheWriter]:
+    if not settings.PAGE_CACHE_ENABLED or not content_hash:
+        return None
+    return PageCacheWriter(content_hash, page_count)
+
+def _entries() -> list[tuple[float, int, str]]:
+    entries = []
+    for root, _, files in os.walk(settings.PAGE_CACHE_DIR):
+        for name in files:
+            if name.endswith(SUFFIX):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+def prune(max_bytes: Optional[int] = None) -> int:
+    """
+    Evicts least recently used entries until the cache fits in `max_bytes`.
+    Returns the number of bytes freed.
+    """
+    max_bytes = settings.PAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _prune_lock:
+        entries = sorted(_entries())
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                continue
+    if freed:
+        logger.info(f"Page cache pruned {freed} bytes")
+    return freed
+
+def stats() -> dict:
+    entries = _entries()
+    return {
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": settings.PAGE_CACHE_MAX_BYTES,
+    }
+
+def _warm_file(path: str) -> bool:
+    import hashlib
+    from backend.app.services.ingestion import iter_pages
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(settings.UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    if contains(content_hash):
+        return False
+
+    with open(path, "rb") as f:
+        for _ in iter_pages(f, content_hash=content_hash, source_path=path):
+            pass
+    return True
+
+def _warm_documents() -> int:
+    from backend.app.db.base import SessionLocal
+    from backend.app.models import Document
+    from backend.app.services.storage import storage_service
+
+    warmed = 0
+    db = SessionLocal()
+    try:
+        documents = db.query(Document).filter(Document.content_hash.isnot(None)).all()
+        for document in {doc.content_hash: doc for doc in documents}.values():
+            if contains(document.content_hash):
+                continue
+            relative_path = storage_service.path_from_url(document.file_path)
+            if not relative_path:
+                continue
+            local_path = storage_service.download_to_temp(relative_path)
+            try:
+                warmed += _warm_file(local_path)
+            except Exception as e:
+                logger.error(f"Failed to warm {document.filename}: {e}")
+            finally:
+                os.remove(local_path)
+    finally:
+        db.close()
+    return warmed
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the parsed page text cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    warm = commands.add_parser("warm", help="Extract PDFs into the cache")
+    warm.add_argument("paths", nargs="*", help="Local PDF files")
+    warm.add_argument("--documents", action="store_true", help="Download and cache every stored Document")
+
+    prune_cmd = commands.add_parser("prune", help="Evict least recently used entries")
+    prune_cmd.add_argument("--max-bytes", type=int, default=None, help="Target size (default: PAGE_CACHE_MAX_BYTES)")
+
+    commands.add_parser("stats", help="Show cache size")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "warm":
+        warmed = sum(_warm_file(path) for path in args.paths)
+        if args.documents:
+            warmed += _warm_documents()
+        print(f"Warmed {warmed} file(s).")
+    elif args.command == "prune":
+        print(f"Freed {prune(args.max_bytes)} bytes.")
+    print(stats())
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,52 @@
+import asyncio
 import logging
-from typing import List
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import SupabaseVectorStore
-from supabase.client import create_client
+from typing import Collection, Dict, Iterator, List, Optional, Tuple
 from backend.app.core.config import settings
+from backend.app.core.cache import LRUCache
+from backend.app.services.embedding_batcher import BatchingEmbeddings
+from backend.app.services.embeddings import LazyEmbeddings, build_embeddings, embedding_model_id
+from backend.app.services.sparse_index import reciprocal_rank_fusion, sparse_index
+from backend.app.services.supabase_client import supabase_clients
+from backend.app.services.vector_stores import build_vector_store
 
 logger = logging.getLogger(__name__)
 
+def _load_embeddings():
+    model = build_embeddings()
+    if settings.EMBEDDING_BATCH_ENABLED:
+        # Coalesce concurrent chat/research/ingestion calls into batched forward passes
+        model = BatchingEmbeddings(
+            model,
+            max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+            max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS
+        )
+    return model
+
 class RAGService:
     _instance = None
     _embeddings = None
-    _supabase = None
     _vector_store = None
+    _query_cache: LRUCache = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(RAGService, cls).__new__(cls)
             
-            # 1. Load Embeddings
-            logger.info("Loading Embedding Model...")
-            cls._embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+            # 1. Embeddings: loaded on first use or by warm_up() after startup
+            cls._embeddings = LazyEmbeddings(_load_embeddings)
             
-            # 2. Initialize Supabase Client for Vector Store
-            if settings.SUPABASE_URL and settings.SUPABASE_KEY:
-                try:
-                    cls._supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-                    
-                    # Initialize Vector Store wrapper
-                    # Note: Table name defaults to 'documents'. 
-                    # query_name defaults to 'match_documents'.
-                    cls._vector_store = SupabaseVectorStore(
-                        client=cls._supabase,
-                        embedding=cls._embeddings,
-                        table_name="documents",
-                        query_name="match_documents"
-                    )
-                    logger.info("Supabase Vector Store initialized.")
-                except Exception as e:
-                    logger.error(f"Failed to init Supabase Vector: {e}")
-            else:
-                logger.warning("Supabase credentials missing. RAG service limited.")
+            # Repeated queries (fixed analysis prompts, re-asked questions) skip the forward pass
+            cls._query_cache = LRUCache(
+                max_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+                ttl_seconds=settings.QUERY_EMBEDDING_CACHE_TTL_SECONDS
+            )
+
+            # 2. Vector store selected by VECTOR_STORE_BACKEND (Supabase over the connection pool
+            # shared with the storage service)
+            try:
+                cls._vector_store = build_vector_store(supabase_clients)
+            except Exception as e:
+                logger.error(f"Failed to init Vector Store: {e}")
                 
         return cls._instance
 
@@ -47,9 +54,78 @@ class RAGService:
     def embeddings(self):
         return self._embeddings
 
+    @property
+    def vector_store(self):
+        return self._vector_store
+
+    def warm_up(self):
+        """
+        Starts loading the embedding model in the background.
+        """
+        logger.info("Loading Embedding Model...")
+        self._embeddings.warm_up()
+
+    def readiness(self) -> dict:
+        return {
+            "embedding_model": embedding_model_id(),
+            "embedding_model_loaded": self._embeddings.is_ready,
+            "embedding_model_error": self._embeddings.error,
+            "vector_store": self._vector_store.name if self._vector_store else None,
+        }
+
+    def stats(self) -> dict:
+        """
+        Runtime metrics for the admin dashboard.
+        """
+        model = self._embeddings.loaded_model
+        return {
+            "embedding_batcher": model.stats() if isinstance(model, BatchingEmbeddings) else None,
+            "query_embedding_cache": self._query_cache.stats(),
+        }
+
+    def _query_cache_key(self, query: str) -> tuple:
+        # Whitespace never changes the embedding; case only matters to cased tokenizers
+        # (keys stay exact until the model is loaded and its tokenizer known)
+        text = " ".join(query.split())
+        if self._embeddings.lowercases:
+            text = text.lower()
+        return (embedding_model_id(), text)
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embeds a search query, served from the LRU cache when the same query was seen recently.
+        """
+        key = self._query_cache_key(query)
+        embedding = self._query_cache.get(key)
+        if embedding is None:
+            embedding = self._embeddings.embed_query(query)
+            self._query_cache.set(key, embedding)
+        return embedding
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embeds several search queries, with every cache miss embedded in a single batch.
+        """
+        keys = [self._query_cache_key(query) for query in queries]
+        embeddings = [self._query_cache.get(key) for key in keys]
+
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            # MiniLM is symmetric: a query embedding is a one-text document embedding
+            first = [positions[0] for positions in missing.values()]
+            vectors = self._embeddings.embed_documents([queries[i] for i in first])
+            for (key, positions), vector in zip(missing.items(), vectors):
+                self._query_cache.set(key, vector)
+                for i in positions:
+                    embeddings[i] = vector
+        return embeddings
+
     def add_documents(self, project_id: int, texts: List[str], metadatas: List[dict] = None) -> bool:
         """
-        Embeds and pushes documents to Supabase Vector Store.
+        Embeds and pushes documents to the vector store.
         """
         if not self._vector_store:
             logger.error("Vector Store not initialized.")
@@ -67,36 +143,257 @@ class RAGService:
                     meta["project_id"] = project_id
                     enriched_metadatas.append(meta)
             else:
-                enriched_metadatas = [{"project_id": project_id}] * len(texts)
+                enriched_metadatas = [{"project_id": project_id} for _ in texts]
 
-            self._vector_store.add_texts(texts, metadatas=enriched_metadatas)
+            vectors = self._embeddings.embed_documents(texts)
+            self._vector_store.add_vectors(project_id, texts, vectors, enriched_metadatas)
             return True
         except Exception as e:
-            logger.error(f"Error adding documents to Supabase: {e}")
+            logger.error(f"Error adding documents to {self._vector_store.name}: {e}")
             return False
 
-    def similarity_search(self, project_id: int, query: str, k: int = 4, filter: dict = None) -> List[dict]:
+    def flush_vectors(self, project_id: Optional[int] = None):
         """
-        Performs similarity search on Supabase.
-        Uses Metadata filtering for Project ID (Essential in shared table!).
+        Persists vectors the store buffers in memory (FAISS saves once per document, not per batch).
+        """
+        if self._vector_store:
+            self._vector_store.flush(project_id)
+
+    def copy_document_vectors(
+        self,
+        source_project_id: int,
+        source_document_id: int,
+        project_id: int,
+        document_id: int,
+        source: str = None,
+    ) -> int:
+        """
+        Re-uses the stored chunks and embeddings of an already indexed document for a new one.
+        Rows are copied with the new project/document metadata, skipping parsing and embedding.
+        Returns the number of chunks copied.
+        """
+        if not self._vector_store:
+            logger.error("Vector Store not initialized.")
+            return 0
+
+        copied = 0
+        for rows in self._vector_store.iter_document_rows(source_project_id, source_document_id):
+            texts = []
+            vectors = []
+            metadatas = []
+            for content, meta, vector in rows:
+                meta["project_id"] = project_id
+                meta["document_id"] = document_id
+                if source:
+                    meta["source"] = source
+                texts.append(content)
+                vectors.append(vector)
+                metadatas.append(meta)
+
+            self._vector_store.add_vectors(project_id, texts, vectors, metadatas)
+            copied += len(texts)
+        self._vector_store.flush(project_id)
+
+        sparse_index.copy_document(source_project_id, source_document_id, project_id, document_id, source=source)
+        return copied
+
+    def iter_document_chunks(self, project_id: int, document_id: int) -> Iterator[List[Tuple[str, dict]]]:
+        """
+        Yields the stored (content, metadata) of a document's chunks, page by page.
+        """
+        if not self._vector_store:
+            return
+        for rows in self._vector_store.iter_document_rows(project_id, document_id):
+            yield [(content, meta) for content, meta, _ in rows]
+
+    def get_chunk_fingerprints(self, project_id: int, document_id: int) -> Dict[str, List[Tuple[str, Optional[int]]]]:
+        """
+        Maps each stored chunk_hash of a document to the (id, page) of its vector rows.
+        Rows indexed before chunk fingerprints existed are grouped under "".
         """
         if not self._vector_store:
-            return []
+            return {}
+        return self._vector_store.get_chunk_fingerprints(project_id, document_id)
+
+    def update_chunk_metadata(self, project_id: int, metadatas: Dict[str, dict]) -> int:
+        """
+        Replaces the metadata of existing vector rows (id -> metadata), keeping their vectors.
+        Returns the number of rows updated.
+        """
+        if not self._vector_store or not metadatas:
+            return 0
 
         try:
-            # Construct Filter
-            # SupabaseVectorStore filter format: dict of metadata fields
-            query_filter = {"project_id": project_id}
-            
-            # Merge with existing filter if any (like document_id)
-            if filter:
-                query_filter.update(filter)
-            
-            docs = self._vector_store.similarity_search(query, k=k, filter=query_filter)
-            
-            return [{"content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+            return self._vector_store.update_metadata(project_id, metadatas)
+        except Exception as e:
+            logger.error(f"Error updating chunk metadata in {self._vector_store.name}: {e}")
+            return 0
+
+    def delete_vectors(self, project_id: int, ids: List[str]) -> int:
+        """
+        Deletes vector rows by id. Returns the number of ids removed.
+        """
+        if not self._vector_store or not ids:
+            return 0
+
+        try:
+            return self._vector_store.delete(project_id, ids)
+        except Exception as e:
+            logger.error(f"Error deleting vectors from {self._vector_store.name}: {e}")
+            return 0
+
+    def delete_document_vectors(self, project_id: int, document_id: int) -> int:
+        """
+        Deletes every vector (and sparse index entry) of a document. Returns the number of vectors removed.
+        """
+        sparse_index.delete_document(project_id, document_id)
+        if not self._vector_store:
+            return 0
+        try:
+            return self._vector_store.delete_document(project_id, document_id)
         except Exception as e:
-            logger.error(f"Error searching Supabase Vector: {e}")
-            return []
+            # Left for the vector GC to collect
+            logger.error(f"Error deleting vectors of document {document_id} from {self._vector_store.name}: {e}")
+            return 0
+
+    def similarity_search(
+        self,
+        project_id: int,
+        query: str,
+        k: int = 4,
+        filter: dict = None,
+        document_ids: Optional[Collection[int]] = None,
+        mode: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Performs similarity search within a project.
+        Supabase scopes by the project_id metadata filter (essential in the shared table!);
+        FAISS keeps a separate index per project.
+        When `document_ids` is given, only chunks of those documents are searched, so the
+        top k results are all usable (an empty collection matches nothing).
+        `mode` ("dense" or "hybrid", default RETRIEVAL_MODE) selects whether BM25 results
+        from the sparse index are fused in.
+        """
+        return self.similarity_search_many(
+            project_id, [query], k=k, filter=filter, document_ids=document_ids, mode=mode
+        )["results"][0]
+
+    def similarity_search_many(
+        self,
+        project_id: int,
+        queries: List[str],
+        k: int = 4,
+        filter: dict = None,
+        document_ids: Optional[Collection[int]] = None,
+        mode: Optional[str] = None,
+    ) -> dict:
+        """
+        Runs several searches at once: all queries are embedded in one batch and searched
+        concurrently (FAISS: in one vectorized call).
+        Returns {"results": one result list per query, "merged": all results deduplicated,
+        ranked by reciprocal rank fusion so chunks found by several queries come first}.
+        """
+        if not self._can_search(queries, document_ids):
+            return self._combine(queries, None, None, k)
+
+        hybrid = self._is_hybrid(mode, filter)
+        try:
+            dense = self._vector_store.search_many(
+                project_id,
+                self.embed_queries(queries),
+                k=self._dense_k(k, hybrid),
+                filter=filter,
+                document_ids=document_ids
+            )
+        except Exception as e:
+            logger.error(f"Error searching {self._vector_store.name} Vector: {e}")
+            dense = None
+
+        sparse = self._sparse_search_many(project_id, queries, k, document_ids) if hybrid else None
+        return self._combine(queries, dense, sparse, k)
+
+    async def asimilarity_search(
+        self,
+        project_id: int,
+        query: str,
+        k: int = 4,
+        filter: dict = None,
+        document_ids: Optional[Collection[int]] = None,
+        mode: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Async similarity_search().
+        """
+        result = await self.asimilarity_search_many(
+            project_id, [query], k=k, filter=filter, document_ids=document_ids, mode=mode
+        )
+        return result["results"][0]
+
+    async def asimilarity_search_many(
+        self,
+        project_id: int,
+        queries: List[str],
+        k: int = 4,
+        filter: dict = None,
+        document_ids: Optional[Collection[int]] = None,
+        mode: Optional[str] = None,
+    ) -> dict:
+        """
+        Async similarity_search_many(): embedding and the sparse index run in worker threads,
+        Supabase searches go over the shared async connection pool without holding a thread.
+        """
+        if not self._can_search(queries, document_ids):
+            return self._combine(queries, None, None, k)
+
+        hybrid = self._is_hybrid(mode, filter)
+
+        async def dense_search():
+            try:
+                vectors = await asyncio.to_thread(self.embed_queries, queries)
+                return await self._vector_store.asearch_many(
+                    project_id, vectors, k=self._dense_k(k, hybrid), filter=filter, document_ids=document_ids
+                )
+            except Exception as e:
+                logger.error(f"Error searching {self._vector_store.name} Vector: {e}")
+                return None
+
+        if not hybrid:
+            return self._combine(queries, await dense_search(), None, k)
+        dense, sparse = await asyncio.gather(
+            dense_search(),
+            asyncio.to_thread(self._sparse_search_many, project_id, queries, k, document_ids)
+        )
+        return self._combine(queries, dense, sparse, k)
+
+    def _can_search(self, queries: List[str], document_ids: Optional[Collection[int]]) -> bool:
+        if not self._vector_store or not queries:
+            return False
+        return document_ids is None or bool(document_ids)
+
+    def _is_hybrid(self, mode: Optional[str], filter: Optional[dict]) -> bool:
+        mode = mode or settings.RETRIEVAL_MODE
+        return mode == "hybrid" and sparse_index.enabled and not filter
+
+    def _dense_k(self, k: int, hybrid: bool) -> int:
+        # Hybrid: BM25 supplies the long tail, so fewer (costly) vector candidates are needed
+        return min(k, settings.HYBRID_DENSE_K) if hybrid else k
+
+    def _sparse_search_many(self, project_id: int, queries: List[str], k: int, document_ids) -> List[List[dict]]:
+        sparse_k = max(k, settings.HYBRID_SPARSE_K)
+        return [sparse_index.search(project_id, query, k=sparse_k, document_ids=document_ids) for query in queries]
+
+    def _combine(self, queries: List[str], dense: Optional[List[List[dict]]], sparse: Optional[List[List[dict]]], k: int) -> dict:
+        results = dense or [[] for _ in queries]
+        if sparse is not None:
+            results = [
+                reciprocal_rank_fusion([dense_results, sparse_results], k=k, rrf_k=settings.RRF_K)
+                for dense_results, sparse_results in zip(results, sparse)
+            ]
+
+        merged_size = sum(len(result) for result in results)
+        return {
+            "results": results,
+            "merged": reciprocal_rank_fusion(results, k=merged_size, rrf_k=settings.RRF_K),
+        }
 
 rag_service = RAGService()
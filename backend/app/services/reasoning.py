@@ -1,11 +1,44 @@
+import asyncio
 import logging
 import json
+import random
+from typing import AsyncIterator, Dict
+import httpx
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from backend.app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Part of stored analysis fingerprints: bump when the analysis or summary prompts change
+ANALYSIS_PROMPT_VERSION = "1"
+
+ANALYSIS_ERROR_RESULT = {
+    "research_gaps": ["Error generating gaps."],
+    "methodology_suggestions": ["Error generating suggestions."]
+}
+
+# Rate limiting, request timeouts and server errors; anything else (auth, invalid argument,
+# prompt too long, ...) fails the same way on every attempt
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+def _is_retryable(error: BaseException) -> bool:
+    """
+    True for timeouts, connection failures and retryable HTTP statuses, looking through
+    wrapped causes (the LangChain client re-raises SDK errors in its own exception type).
+    """
+    while error is not None:
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError)):
+            return True
+        # google.api_core errors carry the HTTP status as `code`, httpx errors on the response
+        status = getattr(error, "code", None)
+        if not isinstance(status, int):
+            status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(status, int):
+            return status in RETRYABLE_STATUS_CODES
+        error = error.__cause__ or error.__context__
+    return False
+
 class ReasoningService:
     def __init__(self):
         # Chat Model: Fast, low latency (Default: Gemini 1.5 Flash)
@@ -22,6 +55,89 @@ class ReasoningService:
             temperature=0.4
         )
 
+        # Async calls in flight per model name (chat and research may share a model)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        return self._semaphores[model]
+
+    async def _call(self, chain, model: str, inputs: dict):
+        async with self._semaphore(model):
+            return await asyncio.wait_for(chain.ainvoke(inputs), settings.LLM_TIMEOUT_SECONDS)
+
+    async def _hedged_call(self, chain, model: str, inputs: dict):
+        """
+        One attempt; if it has not answered after LLM_HEDGE_AFTER_SECONDS, a second identical
+        request is sent and whichever succeeds first is used.
+        """
+        hedge_after = settings.LLM_HEDGE_AFTER_SECONDS
+        if hedge_after <= 0:
+            return await self._call(chain, model, inputs)
+
+        tasks = [asyncio.ensure_future(self._call(chain, model, inputs))]
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                logger.info(f"{model} slower than {hedge_after}s, sending hedged request")
+                tasks.append(asyncio.ensure_future(self._call(chain, model, inputs)))
+                pending = set(tasks)
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _ainvoke(self, chain, model: str, inputs: dict):
+        """
+        chain.ainvoke() under the model's concurrency limit, with a per-attempt deadline
+        (LLM_TIMEOUT_SECONDS) and up to LLM_MAX_RETRIES retries with jittered exponential backoff
+        for transient failures (timeouts, 429, 5xx, connection errors).
+        """
+        attempts = settings.LLM_MAX_RETRIES + 1
+        for attempt in range(attempts):
+            try:
+                return await self._hedged_call(chain, model, inputs)
+            except Exception as e:
+                if attempt == attempts - 1 or not _is_retryable(e):
+                    raise
+                delay = settings.LLM_RETRY_BACKOFF_SECONDS * 2 ** attempt
+                delay += random.uniform(0, delay)
+                logger.warning(f"{model} call failed ({e!r}), retry {attempt + 1}/{attempts - 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _astream(self, chain, model: str, inputs: dict) -> AsyncIterator[str]:
+        """
+        chain.astream() text fragments under the model's concurrency limit. Fails with a
+        TimeoutError if the first or any following fragment takes longer than
+        LLM_STREAM_IDLE_TIMEOUT_SECONDS, so a stalled stream cannot hold its slot.
+        """
+        async with self._semaphore(model):
+            stream = chain.astream(inputs).__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), settings.LLM_STREAM_IDLE_TIMEOUT_SECONDS)
+                    except StopAsyncIteration:
+                        return
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(f"{model} stream idle for {settings.LLM_STREAM_IDLE_TIMEOUT_SECONDS}s")
+                    text = self._extract_text(chunk.content)
+                    if text:
+                        yield text
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if aclose:
+                    await aclose()
+
     def _extract_text(self, content) -> str:
         """
         Helper to normalize LLM response content to string.
@@ -42,7 +158,7 @@ class ReasoningService:
             return "\n".join(parts)
         return str(content)
 
-    def get_answer(self, query: str, context: str, chat_history: str = "") -> str:
+    def _answer_chain(self):
         prompt = PromptTemplate(
             input_variables=["context", "question", "chat_history"],
             template="""
@@ -68,15 +184,30 @@ class ReasoningService:
             5. Keep the answer concise and academic.
             """
         )
-        chain = prompt | self.chat_llm
+        return prompt | self.chat_llm
+
+    def get_answer(self, query: str, context: str, chat_history: str = "") -> str:
+        chain = self._answer_chain()
         response = chain.invoke({"context": context, "question": query, "chat_history": chat_history})
         return self._extract_text(response.content)
 
-    def analyze_project(self, combined_context: str) -> dict:
+    async def aget_answer(self, query: str, context: str, chat_history: str = "") -> str:
+        chain = self._answer_chain()
+        response = await self._ainvoke(
+            chain, settings.CHAT_MODEL, {"context": context, "question": query, "chat_history": chat_history}
+        )
+        return self._extract_text(response.content)
+
+    async def astream_answer(self, query: str, context: str, chat_history: str = "") -> AsyncIterator[str]:
         """
-        Performs high-level analysis to find research gaps and suggestions.
-        Returns a JSON-compatible dict.
+        Streams the chat answer as text fragments, as the model generates them.
         """
+        chain = self._answer_chain()
+        inputs = {"context": context, "question": query, "chat_history": chat_history}
+        async for text in self._astream(chain, settings.CHAT_MODEL, inputs):
+            yield text
+
+    def _analysis_chain(self):
         prompt = PromptTemplate(
             input_variables=["context"],
             template="""
@@ -102,23 +233,101 @@ class ReasoningService:
             - Do not include markdown formatting (like ```json), just the raw JSON string.
             """
         )
-        chain = prompt | self.research_llm
+        return prompt | self.research_llm
+
+    def _parse_analysis(self, response) -> dict:
+        content_str = self._extract_text(response.content)
+        content = content_str.replace("```json", "").replace("```", "").strip()
+        return json.loads(content)
+
+    def _analysis_error(self, e: Exception) -> dict:
+        logger.error(f"Error in analysis: {e}")
+        return {key: list(value) for key, value in ANALYSIS_ERROR_RESULT.items()}
+
+    def analyze_project(self, combined_context: str) -> dict:
+        """
+        Performs high-level analysis to find research gaps and suggestions.
+        Returns a JSON-compatible dict.
+        """
+        chain = self._analysis_chain()
         try:
-            response = chain.invoke({"context": combined_context})
-            content_str = self._extract_text(response.content)
-            content = content_str.replace("```json", "").replace("```", "").strip()
-            return json.loads(content)
+            return self._parse_analysis(chain.invoke({"context": combined_context}))
         except Exception as e:
-            logger.error(f"Error in analysis: {e}")
-            return {
-                "research_gaps": ["Error generating gaps."],
-                "methodology_suggestions": ["Error generating suggestions."]
-            }
+            return self._analysis_error(e)
 
-    def perform_deep_research(self, query: str, context: str, chat_history: str = "", project_title: str = "", project_description: str = "") -> dict:
+    async def aanalyze_project(self, combined_context: str) -> dict:
         """
-        Generates a comprehensive research report based on the query, context, and chat history.
+        Async analyze_project().
+        """
+        chain = self._analysis_chain()
+        try:
+            response = await self._ainvoke(chain, settings.RESEARCH_MODEL, {"context": combined_context})
+            return self._parse_analysis(response)
+        except Exception as e:
+            return self._analysis_error(e)
+
+    def _summary_chain(self):
+        prompt = PromptTemplate(
+            input_variables=["context", "document"],
+            template="""
+            You are a research assistant preparing notes for a gap analysis across several papers.
+            Summarize the paper "{document}" using ONLY the excerpts below.
+
+            Excerpts:
+            {context}
+
+            Write short bullet points under exactly these headings:
+            Methods: the approach, models and techniques used.
+            Evaluations: datasets, metrics, baselines and main results.
+            Limitations: weaknesses, assumptions and future work stated or evident in the excerpts.
+            Write "Not stated" under a heading the excerpts say nothing about. No other text.
+            """
+        )
+        return prompt | self.chat_llm
+
+    async def asummarize_document(self, document: str, context: str) -> str:
+        """
+        Map step of the map-reduce analysis: methods, evaluations and limitations of one paper.
+        Returns an empty string if the call fails, so one paper cannot sink the whole analysis.
+        """
+        chain = self._summary_chain()
+        try:
+            response = await self._ainvoke(chain, settings.CHAT_MODEL, {"context": context, "document": document})
+            return self._extract_text(response.content).strip()
+        except Exception as e:
+            logger.error(f"Error summarizing {document}: {e}")
+            return ""
+
+    def summarize_conversation(self, summary: str, transcript: str) -> str:
+        """
+        Folds older messages into the running conversation summary (chat model, sync:
+        runs on the memory worker thread). Raises on failure so the messages stay unsummarized.
         """
+        prompt = PromptTemplate(
+            input_variables=["summary", "transcript", "max_words"],
+            template="""
+            You maintain the memory of a conversation between a student and a research assistant.
+
+            Current summary:
+            {summary}
+
+            New messages:
+            {transcript}
+
+            Rewrite the summary to include the new messages, in at most {max_words} words.
+            Keep the topics asked about, conclusions and recommendations given, papers cited and
+            open questions; drop greetings and wording. Return only the summary text.
+            """
+        )
+        chain = prompt | self.chat_llm
+        response = chain.invoke({
+            "summary": summary or "(empty)",
+            "transcript": transcript,
+            "max_words": settings.MEMORY_SUMMARY_MAX_WORDS
+        })
+        return self._extract_text(response.content).strip()
+
+    def _research_chain(self):
         prompt = PromptTemplate(
             input_variables=["context", "question", "chat_history", "project_title", "project_description"],
             template="""
@@ -159,7 +368,13 @@ class ReasoningService:
             - ADAPT YOUR OUTPUT LENGTH. Don't write a thesis usage for "Hi".
             """
         )
-        chain = prompt | self.research_llm
+        return prompt | self.research_llm
+
+    def perform_deep_research(self, query: str, context: str, chat_history: str = "", project_title: str = "", project_description: str = "") -> dict:
+        """
+        Generates a comprehensive research report based on the query, context, and chat history.
+        """
+        chain = self._research_chain()
         try:
             response = chain.invoke({
                 "context": context, 
@@ -173,4 +388,36 @@ class ReasoningService:
             logger.error(f"Error in deep research: {e}")
             return {"report": "## Error\nFailed to generate research report."}
 
+    async def aperform_deep_research(self, query: str, context: str, chat_history: str = "", project_title: str = "", project_description: str = "") -> dict:
+        """
+        Async perform_deep_research().
+        """
+        chain = self._research_chain()
+        try:
+            response = await self._ainvoke(chain, settings.RESEARCH_MODEL, {
+                "context": context,
+                "question": query,
+                "chat_history": chat_history,
+                "project_title": project_title,
+                "project_description": project_description
+            })
+            return {"report": self._extract_text(response.content)}
+        except Exception as e:
+            logger.error(f"Error in deep research: {e}")
+            return {"report": "## Error\nFailed to generate research report."}
+
+    async def astream_research(self, query: str, context: str, chat_history: str = "", project_title: str = "", project_description: str = "") -> AsyncIterator[str]:
+        """
+        Streams the deep research report as text fragments, as the model generates them.
+        """
+        chain = self._research_chain()
+        async for text in self._astream(chain, settings.RESEARCH_MODEL, {
+            "context": context,
+            "question": query,
+            "chat_history": chat_history,
+            "project_title": project_title,
+            "project_description": project_description
+        }):
+            yield text
+
 reasoning_service = ReasoningService()
@@ -0,0 +1,363 @@
+"""
+Per-project BM25 inverted index over the ingested chunks.
+
+Each project gets one SQLite file under SPARSE_INDEX_DIR holding the chunk text and
+metadata plus a (term, chunk) postings table. Exact terms such as dataset, metric and
+model names are matched literally here, complementing the dense MiniLM vectors;
+RAGService fuses the two rankings (see reciprocal_rank_fusion).
+
+CLI (run from the repository root):
+    python -m backend.app.services.sparse_index rebuild [--project ID]
+    python -m backend.app.services.sparse_index stats
+"""
+import argparse
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Collection, Dict, Hashable, List, Optional
+from backend.app.core.cache import LRUCache
+from backend.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keeps compound terms ("imagenet-1k", "gpt-3.5", "f1_score") together; their parts are indexed too
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+_COMPOUND_SPLIT = re.compile(r"[-_.]")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their "
+    "this to was were which with we our these those than then there can also not".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _COMPOUND_SPLIT.split(token) if part and part not in _STOPWORDS)
+    return tokens
+
+def _result_key(doc: dict) -> Hashable:
+    meta = doc.get("metadata", {})
+    return (meta.get("document_id"), meta.get("chunk_hash") or doc.get("content"))
+
+def reciprocal_rank_fusion(rankings: List[List[dict]], k: int, rrf_k: int = 60) -> List[dict]:
+    """
+    Merges ranked result lists: each result scores sum(1 / (rrf_k + rank)) over the lists
+    it appears in. Only ranks are used, so BM25 and cosine scores need no normalising.
+    """
+    scores: Dict[Hashable, float] = defaultdict(float)
+    docs: Dict[Hashable, dict] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = _result_key(doc)
+            scores[key] += 1 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    return [docs[key] for key, _ in best]
+
+class SparseIndex:
+    """
+    BM25 index for one project, stored in a single SQLite file.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = None # (chunk count, average length), reset on writes
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY,"
+            " document_id INTEGER,"
+            " content TEXT NOT NULL,"
+            " metadata TEXT NOT NULL,"
+            " length INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS ix_chunks_document_id ON chunks (document_id);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL,"
+            " chunk_id INTEGER NOT NULL,"
+            " tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS ix_postings_chunk_id ON postings (chunk_id);"
+        )
+        self.db.commit()
+
+    def add(self, texts: List[str], metadatas: List[dict]) -> int:
+        with self._lock:
+            for text, meta in zip(texts, metadatas):
+                counts = Counter(tokenize(text))
+                cursor = self.db.execute(
+                    "INSERT INTO chunks (document_id, content, metadata, length) VALUES (?, ?, ?, ?)",
+                    (meta.get("document_id"), text, json.dumps(meta), sum(counts.values()))
+                )
+                self.db.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, tf) for term, tf in counts.items()]
+                )
+            self.db.commit()
+            self._stats = None
+        return len(texts)
+
+    def delete_document(self, document_id: int) -> int:
+        with self._lock:
+            self.db.execute(
+                "DELETE FROM postings WHERE chunk_id IN (SELECT id FROM chunks WHERE document_id = ?)", (document_id,)
+            )
+            deleted = self.db.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,)).rowcount
+            self.db.commit()
+            self._stats = None
+        return deleted
+
+    def document_ids(self) -> List[int]:
+        with self._lock:
+            return [row[0] for row in self.db.execute("SELECT DISTINCT document_id FROM chunks")]
+
+    def vacuum(self):
+        with self._lock:
+            self.db.execute("VACUUM")
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    def document_rows(self, document_id: int) -> List[tuple]:
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT content, metadata FROM chunks WHERE document_id = ? ORDER BY id", (document_id,)
+            ).fetchall()
+        return [(content, json.loads(meta)) for content, meta in rows]
+
+    def _collection_stats(self) -> tuple:
+        if self._stats is None:
+            count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+            self._stats = (count, total / count if count else 0.0)
+        return self._stats
+
+    def search(self, query: str, k: int, document_ids: Optional[Collection[int]] = None) -> List[dict]:
+        terms = sorted(set(tokenize(query)))
+        if not terms or (document_ids is not None and not document_ids):
+            return []
+
+        term_marks = ",".join("?" * len(terms))
+        with self._lock:
+            count, avg_length = self._collection_stats()
+            if not count:
+                return []
+            # Document frequency over the whole project, so idf doesn't depend on the selection
+            idf = {
+                term: math.log(1 + (count - df + 0.5) / (df + 0.5))
+                for term, df in self.db.execute(
+                    f"SELECT term, COUNT(*) FROM postings WHERE term IN ({term_marks}) GROUP BY term", terms
+                )
+            }
+            sql = (
+                "SELECT p.chunk_id, p.term, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk_id "
+                f"WHERE p.term IN ({term_marks})"
+            )
+            params = list(terms)
+            if document_ids is not None:
+                sql += f" AND c.document_id IN ({','.join('?' * len(document_ids))})"
+                params.extend(document_ids)
+
+            scores: Dict[int, float] = defaultdict(float)
+            for chunk_id, term, tf, length in self.db.execute(sql, params):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[chunk_id] += idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            if not best:
+                return []
+            rows = {
+                chunk_id: (content, meta)
+                for chunk_id, content, meta in self.db.execute(
+                    f"SELECT id, content, metadata FROM chunks WHERE id IN ({','.join('?' * len(best))})",
+                    [chunk_id for chunk_id, _ in best]
+                )
+            }
+        return [
+            {"content": rows[chunk_id][0], "metadata": json.loads(rows[chunk_id][1]), "score": score}
+            for chunk_id, score in best
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, avg_length = self._collection_stats()
+            terms = self.db.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+        return {"chunks": count, "terms": terms, "avg_length": avg_length, "bytes": os.path.getsize(self.path)}
+
+class SparseIndexService:
+    _instance = None
+    _indexes: LRUCache = None
+    _open_lock = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SparseIndexService, cls).__new__(cls)
+            cls._indexes = LRUCache(max_size=settings.SPARSE_MAX_OPEN_INDEXES)
+            cls._open_lock = threading.Lock()
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return settings.SPARSE_INDEX_ENABLED
+
+    def _path(self, project_id: int) -> str:
+        return os.path.join(settings.SPARSE_INDEX_DIR, f"project_{project_id}.sqlite3")
+
+    def _index(self, project_id: int, create: bool = True) -> Optional[SparseIndex]:
+        index = self._indexes.get(project_id)
+        if index is None:
+            with self._open_lock:
+                index = self._indexes.get(project_id)
+                if index is None:
+                    if not create and not os.path.exists(self._path(project_id)):
+                        return None
+                    index = SparseIndex(self._path(project_id))
+                    self._indexes.set(project_id, index)
+        return index
+
+    def add(self, project_id: int, texts: List[str], metadatas: List[dict]) -> bool:
+        if not self.enabled or not texts:
+            return False
+        try:
+            self._index(project_id).add(texts, metadatas)
+            return True
+        except Exception as e:
+            logger.error(f"Error adding chunks to the sparse index of project {project_id}: {e}")
+            return False
+
+    def delete_document(self, project_id: int, document_id: int) -> int:
+        index = self._index(project_id, create=False)
+        if index is None:
+            return 0
+        try:
+            return index.delete_document(document_id)
+        except Exception as e:
+            logger.error(f"Error deleting document {document_id} from the sparse index: {e}")
+            return 0
+
+    def project_ids(self) -> List[int]:
+        if not os.path.isdir(settings.SPARSE_INDEX_DIR):
+            return []
+        ids = []
+        for name in os.listdir(settings.SPARSE_INDEX_DIR):
+            stem = name[len("project_"):-len(".sqlite3")]
+            if name.startswith("project_") and name.endswith(".sqlite3") and stem.isdigit():
+                ids.append(int(stem))
+        return ids
+
+    def document_ids(self, project_id: int) -> List[int]:
+        index = self._index(project_id, create=False)
+        return index.document_ids() if index else []
+
+    def drop_project(self, project_id: int):
+        with self._open_lock:
+            index = self._indexes.pop(project_id)
+            if index is not None:
+                index.close()
+            if os.path.exists(self._path(project_id)):
+                os.remove(self._path(project_id))
+
+    def vacuum(self, project_id: int):
+        index = self._index(project_id, create=False)
+        if index is not None:
+            index.vacuum()
+
+    def copy_document(
+        self,
+        source_project_id: int,
+        source_document_id: int,
+        project_id: int,
+        document_id: int,
+        source: str = None,
+    ) -> int:
+        """
+        Copies a document's chunks under a new project/document id (used when an upload is deduplicated).
+        """
+        source_index = self._index(source_project_id, create=False)
+        if not self.enabled or source_index is None:
+            return 0
+        texts = []
+        metadatas = []
+        for content, meta in source_index.document_rows(source_document_id):
+            meta["project_id"] = project_id
+            meta["document_id"] = document_id
+            if source:
+                meta["source"] = source
+            texts.append(content)
+            metadatas.append(meta)
+        return len(texts) if self.add(project_id, texts, metadatas) else 0
+
+    def search(self, project_id: int, query: str, k: int, document_ids: Optional[Collection[int]] = None) -> List[dict]:
+        if not self.enabled:
+            return []
+        index = self._index(project_id, create=False)
+        if index is None:
+            return []
+        try:
+            return index.search(query, k, document_ids=document_ids)
+        except Exception as e:
+            logger.error(f"Error searching the sparse index of project {project_id}: {e}")
+            return []
+
+sparse_index = SparseIndexService()
+
+def _rebuild(project_id: Optional[int] = None) -> int:
+    """
+    Rebuilds sparse entries from the chunks already stored in the vector store
+    (backfill for documents ingested before the sparse index existed).
+    """
+    from backend.app.db.base import SessionLocal
+    from backend.app.models import Document
+    from backend.app.services.rag import rag_service
+
+    rebuilt = 0
+    db = SessionLocal()
+    try:
+        query = db.query(Document)
+        if project_id is not None:
+            query = query.filter(Document.project_id == project_id)
+        for document in query.all():
+            sparse_index.delete_document(document.project_id, document.id)
+            for rows in rag_service.iter_document_chunks(document.project_id, document.id):
+                sparse_index.add(document.project_id, [content for content, _ in rows], [meta for _, meta in rows])
+            rebuilt += 1
+            logger.info(f"Rebuilt sparse index for {document.filename}")
+    finally:
+        db.close()
+    return rebuilt
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the per-project BM25 indexes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild", help="Re-create sparse entries from the stored chunks")
+    rebuild.add_argument("--project", type=int, default=None, help="Only this project id")
+
+    commands.add_parser("stats", help="Show index sizes")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "rebuild":
+        print(f"Rebuilt {_rebuild(args.project)} document(s).")
+    if os.path.isdir(settings.SPARSE_INDEX_DIR):
+        for name in sorted(os.listdir(settings.SPARSE_INDEX_DIR)):
+            if name.endswith(".sqlite3"):
+                print(name, SparseIndex(os.path.join(settings.SPARSE_INDEX_DIR, name)).stats())
+
+if __name__ == "__main__":
+    main()
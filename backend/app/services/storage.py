@@ -1,56 +1,123 @@
 import os
 import logging
-from supabase import create_client, Client
+import tempfile
+from typing import BinaryIO, Optional
+import httpx
 from backend.app.core.config import settings
+from backend.app.services.supabase_client import supabase_clients
 
 logger = logging.getLogger(__name__)
 
 class StorageService:
     _instance = None
-    _client: Client = None
+    _http: httpx.Client = None
     BUCKET_NAME = "uploads"
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(StorageService, cls).__new__(cls)
-            if settings.SUPABASE_URL and settings.SUPABASE_KEY:
-                try:
-                    cls._client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-                    logger.info("Supabase Storage Client Initialized.")
-                except Exception as e:
-                    logger.error(f"Failed to initialize Supabase wrapper: {e}")
+            # Keep-alive connection pool shared with the vector store
+            cls._http = supabase_clients.http
+            if cls._http:
+                logger.info("Supabase Storage Client Initialized.")
             else:
                 logger.warning("Supabase credentials missing. Storage service disabled.")
         return cls._instance
 
+    def public_url(self, destination_path: str) -> str:
+        """
+        Constructs the public URL of an object (or get it from client if method exists).
+        """
+        # Standard pattern: {SUPABASE_URL}/storage/v1/object/public/{BUCKET}/{PATH}
+        return f"{settings.SUPABASE_URL}/storage/v1/object/public/{self.BUCKET_NAME}/{destination_path}"
+
     def upload_file(self, content: bytes, destination_path: str, content_type: str = "application/pdf") -> str:
         """
         Uploads a file to Supabase Storage.
         Returns the public URL or raises an exception.
         """
-        if not self._client:
+        if not self._http:
             raise Exception("Storage service not initialized.")
 
         try:
             # destination_path e.g., "project_1/file.pdf"
-            response = self._client.storage.from_(self.BUCKET_NAME).upload(
-                file=content,
-                path=destination_path,
-                file_options={"content-type": content_type, "upsert": "true"}
+            response = self._http.post(
+                f"/storage/v1/object/{self.BUCKET_NAME}/{destination_path}",
+                content=content,
+                headers={"Content-Type": content_type, "x-upsert": "true"},
+            )
+            response.raise_for_status()
+            return self.public_url(destination_path)
+        except Exception as e:
+            logger.error(f"Upload failed: {e}")
+            raise e
+
+    def upload_stream(self, stream: BinaryIO, size: int, destination_path: str, content_type: str = "application/pdf") -> str:
+        """
+        Uploads a file-like object to Supabase Storage in UPLOAD_CHUNK_SIZE pieces,
+        so the whole file is never held in memory. Returns the public URL.
+        """
+        if not self._http:
+            raise Exception("Storage service not initialized.")
+
+        def chunks():
+            while chunk := stream.read(settings.UPLOAD_CHUNK_SIZE):
+                yield chunk
+
+        try:
+            response = self._http.post(
+                f"/storage/v1/object/{self.BUCKET_NAME}/{destination_path}",
+                content=chunks(),
+                headers={
+                    "Content-Type": content_type,
+                    # An explicit length keeps the body streamed without chunked encoding
+                    "Content-Length": str(size),
+                    "x-upsert": "true",
+                },
             )
-            # Construct public URL (or get it from client if method exists)
-            # Standard pattern: {SUPABASE_URL}/storage/v1/object/public/{BUCKET}/{PATH}
-            public_url = f"{settings.SUPABASE_URL}/storage/v1/object/public/{self.BUCKET_NAME}/{destination_path}"
-            return public_url
+            response.raise_for_status()
+            return self.public_url(destination_path)
         except Exception as e:
             logger.error(f"Upload failed: {e}")
             raise e
 
+    def path_from_url(self, public_url: str) -> Optional[str]:
+        """
+        Inverse of public_url(): "project_8/123_file.pdf" from ".../public/uploads/project_8/123_file.pdf".
+        """
+        if not public_url or "storage/v1/object/public/" not in public_url:
+            return None
+        # Split by bucket name
+        parts = public_url.split(f"/{self.BUCKET_NAME}/", 1)
+        return parts[1] if len(parts) > 1 else None
+
+    def download_to_temp(self, path: str) -> str:
+        """
+        Streams an object into a local temp file and returns its path (caller removes it).
+        """
+        if not self._http:
+            raise Exception("Storage service not initialized.")
+
+        fd, local_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1])
+        try:
+            with os.fdopen(fd, "wb") as f, self._http.stream("GET", f"/storage/v1/object/{self.BUCKET_NAME}/{path}") as response:
+                response.raise_for_status()
+                for chunk in response.iter_bytes(settings.UPLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+            return local_path
+        except Exception as e:
+            logger.error(f"Download failed: {e}")
+            os.remove(local_path)
+            raise e
+
     def delete_file(self, path: str):
-        if not self._client:
+        if not self._http:
             return
         try:
-            self._client.storage.from_(self.BUCKET_NAME).remove([path])
+            response = self._http.request(
+                "DELETE", f"/storage/v1/object/{self.BUCKET_NAME}", json={"prefixes": [path]}
+            )
+            response.raise_for_status()
         except Exception as e:
             logger.error(f"Delete failed: {e}")
 
@@ -0,0 +1,98 @@
+import logging
+from typing import Any, Dict, List, Optional
+import httpx
+from backend.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class SupabaseClients:
+    """
+    The process-wide connections to Supabase, shared by storage and the vector store:
+    pooled keep-alive HTTP clients (sync for worker threads, async for request handlers)
+    talking to the REST (PostgREST) and Storage APIs directly.
+    """
+    _instance = None
+    _http: Optional[httpx.Client] = None
+    _async_http: Optional[httpx.AsyncClient] = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SupabaseClients, cls).__new__(cls)
+            if settings.SUPABASE_URL and settings.SUPABASE_KEY:
+                try:
+                    cls._http = httpx.Client(**cls._http_options())
+                    logger.info("Supabase clients initialized.")
+                except Exception as e:
+                    logger.error(f"Failed to initialize Supabase clients: {e}")
+            else:
+                logger.warning("Supabase credentials missing. Storage and vector store disabled.")
+        return cls._instance
+
+    @staticmethod
+    def _http_options() -> Dict[str, Any]:
+        return {
+            "base_url": settings.SUPABASE_URL,
+            "headers": {
+                "apikey": settings.SUPABASE_KEY,
+                "Authorization": f"Bearer {settings.SUPABASE_KEY}",
+            },
+            "timeout": httpx.Timeout(60.0, connect=10.0),
+            "limits": httpx.Limits(
+                max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SUPABASE_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.SUPABASE_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            "http2": settings.SUPABASE_HTTP2,
+        }
+
+    @property
+    def configured(self) -> bool:
+        return self._http is not None
+
+    @property
+    def http(self) -> Optional[httpx.Client]:
+        return self._http
+
+    @property
+    def async_http(self) -> Optional[httpx.AsyncClient]:
+        """
+        Created on first use, inside the running event loop.
+        """
+        if self._async_http is None and self.configured:
+            type(self)._async_http = httpx.AsyncClient(**self._http_options())
+        return self._async_http
+
+    def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Request over the pooled sync client (worker threads); raises on an error status.
+        """
+        response = self._http.request(method, path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def arequest(self, method: str, path: str, **kwargs) -> httpx.Response:
+        response = await self.async_http.request(method, path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def rpc(self, function: str, params: dict, query: Optional[Dict[str, str]] = None) -> List[dict]:
+        """
+        Calls a Postgres function through PostgREST; `query` carries PostgREST
+        filters/modifiers applied to its result (e.g. {"limit": "5"}).
+        """
+        return self.request("POST", f"/rest/v1/rpc/{function}", json=params, params=query).json()
+
+    async def arpc(self, function: str, params: dict, query: Optional[Dict[str, str]] = None) -> List[dict]:
+        response = await self.arequest("POST", f"/rest/v1/rpc/{function}", json=params, params=query)
+        return response.json()
+
+    async def aclose(self):
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            type(self)._async_http = None
+
+    def close(self):
+        if self._http is not None:
+            self._http.close()
+
+supabase_clients = SupabaseClients()
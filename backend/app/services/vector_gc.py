@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class VectorGarbageCollector:
+    """
+    Removes vectors and sparse index entries whose project or document no longer exists
+    (e.g. deletes that failed half-way, or rows from before vectors were deleted with
+    their document), then compacts the stores.
+    One run at a time; the last report is kept for /admin/metrics.
+    """
+    _instance = None
+    _lock: threading.Lock = None
+    _timer: Optional[threading.Thread] = None
+    last_report: Optional[dict] = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(VectorGarbageCollector, cls).__new__(cls)
+            cls._lock = threading.Lock()
+        return cls._instance
+
+    def run(self, compact: bool = True) -> Optional[dict]:
+        """
+        Collects orphaned vectors. Returns the report, or None if a run is already in progress.
+        """
+        if not self._lock.acquire(blocking=False):
+            logger.info("Vector GC already running, skipping")
+            return None
+        try:
+            return self._run(compact)
+        finally:
+            self._lock.release()
+
+    def _run(self, compact: bool) -> dict:
+        from backend.app.db.base import SessionLocal
+        from backend.app.models import Document, Project
+        from backend.app.services.rag import rag_service
+        from backend.app.services.sparse_index import sparse_index
+
+        started = time.time()
+        store = rag_service.vector_store
+        report = {
+            "started_at": started,
+            "orphaned_documents": 0,
+            "vectors_deleted": 0,
+            "projects_dropped": 0,
+            "sparse_chunks_deleted": 0,
+            "compaction": None,
+        }
+
+        # Scan the stores before reading the live rows: a document created in between
+        # is in the database before any of its vectors exist, so it is never mistaken for an orphan.
+        stored = store.document_counts() if store else {}
+        sparse_projects = {project_id: sparse_index.document_ids(project_id) for project_id in sparse_index.project_ids()}
+
+        db = SessionLocal()
+        try:
+            live_projects = {project_id for (project_id,) in db.query(Project.id)}
+            live_documents = {(project_id, document_id) for project_id, document_id in db.query(Document.project_id, Document.id)}
+        finally:
+            db.close()
+
+        orphans = [key for key in stored if key not in live_documents]
+        report["orphaned_documents"] = len(orphans)
+        dropped = set()
+        for project_id, document_id in orphans:
+            try:
+                if project_id not in live_projects:
+                    if project_id not in dropped:
+                        report["vectors_deleted"] += store.drop_project(project_id)
+                        report["projects_dropped"] += 1
+                        dropped.add(project_id)
+                else:
+                    report["vectors_deleted"] += store.delete_document(project_id, document_id)
+            except Exception as e:
+                logger.error(f"Vector GC failed for document {document_id} of project {project_id}: {e}")
+
+        for project_id, document_ids in sparse_projects.items():
+            if project_id not in live_projects:
+                sparse_index.drop_project(project_id)
+                continue
+            deleted = sum(
+                sparse_index.delete_document(project_id, document_id)
+                for document_id in document_ids
+                if (project_id, document_id) not in live_documents
+            )
+            report["sparse_chunks_deleted"] += deleted
+            if compact and deleted:
+                sparse_index.vacuum(project_id)
+
+        if compact and store:
+            report["compaction"] = store.compact()
+
+        report["duration_seconds"] = time.time() - started
+        logger.info(f"Vector GC finished: {report}")
+        self.last_report = report
+        return report
+
+    def start_schedule(self, interval_seconds: float):
+        """
+        Runs the collector every `interval_seconds` on a daemon thread.
+        """
+        if self._timer is not None or interval_seconds <= 0:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.run()
+                except Exception as e:
+                    logger.error(f"Vector GC failed: {e}")
+
+        self._timer = threading.Thread(target=loop, name="vector-gc", daemon=True)
+        self._timer.start()
+
+vector_gc = VectorGarbageCollector()
@@ -0,0 +1,675 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Collection, Dict, Iterator, List, Optional, Tuple
+from backend.app.core.cache import LRUCache
+from backend.app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single server process is assumed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per request when reading vectors back from Supabase
+VECTOR_PAGE_SIZE = 500
+# Ids per delete request (keeps the filter within URL length limits)
+VECTOR_DELETE_BATCH_SIZE = 100
+
+# (content, metadata, embedding)
+VectorRow = Tuple[str, dict, List[float]]
+
+# Metadata keys usable in a FAISS filter (interpolated into a JSON path)
+_FILTER_KEY = re.compile(r"^\w+$")
+
+class SupabaseBackend:
+    """
+    Shared `documents` table in Supabase (pgvector), scoped to a project by metadata filter.
+    Every call goes to PostgREST over the shared pooled clients of `supabase_clients`.
+    """
+    name = "supabase"
+    TABLE_PATH = "/rest/v1/documents"
+
+    def __init__(self, clients):
+        self._clients = clients
+        self._pool = ThreadPoolExecutor(
+            max_workers=settings.VECTOR_SEARCH_CONCURRENCY, thread_name_prefix="vector-search"
+        )
+
+    def add_vectors(self, project_id: int, texts: List[str], vectors: List[List[float]], metadatas: List[dict]) -> List[str]:
+        ids = [str(uuid.uuid4()) for _ in texts]
+        rows = [
+            {"id": vector_id, "content": text, "embedding": vector, "metadata": meta}
+            for vector_id, text, vector, meta in zip(ids, texts, vectors, metadatas)
+        ]
+        self._clients.request("POST", self.TABLE_PATH, json=rows, headers={"Prefer": "return=minimal"})
+        return ids
+
+    @staticmethod
+    def _match_args(
+        project_id: int,
+        vector: List[float],
+        k: int,
+        filter: Optional[dict],
+        document_ids: Optional[Collection[int]],
+    ) -> Tuple[dict, Dict[str, str]]:
+        # match_documents only supports containment filters; the id list is applied by
+        # PostgREST on the function result, before the limit, so the top k all qualify.
+        query_filter = {"project_id": project_id, **(filter or {})}
+        query = {"limit": str(k)}
+        if document_ids is not None:
+            query["and"] = f"(metadata->>document_id.in.({','.join(str(i) for i in sorted(document_ids))}))"
+        return {"query_embedding": vector, "filter": query_filter}, query
+
+    @staticmethod
+    def _hits(rows: List[dict]) -> List[dict]:
+        return [{"content": row["content"], "metadata": row.get("metadata") or {}} for row in rows if row.get("content")]
+
+    def search(
+        self,
+        project_id: int,
+        vector: List[float],
+        k: int,
+        filter: Optional[dict] = None,
+        document_ids: Optional[Collection[int]] = None,
+    ) -> List[dict]:
+        params, query = self._match_args(project_id, vector, k, filter, document_ids)
+        return self._hits(self._clients.rpc("match_documents", params, query=query))
+
+    def search_many(
+        self,
+        project_id: int,
+        vectors: List[List[float]],
+        k: int,
+        filter: Optional[dict] = None,
+        document_ids: Optional[Collection[int]] = None,
+    ) -> List[List[dict]]:
+        """
+        One match_documents call per query vector, issued concurrently.
+        """
+        if len(vectors) == 1:
+            return [self.search(project_id, vectors[0], k, filter=filter, document_ids=document_ids)]
+        futures = [
+            self._pool.submit(self.search, project_id, vector, k, filter=filter, document_ids=document_ids)
+            for vector in vectors
+        ]
+        return [future.result() for future in futures]
+
+    async def asearch(
+        self,
+        project_id: int,
+        vector: List[float],
+        k: int,
+        filter: Optional[dict] = None,
+        document_ids: Optional[Collection[int]] = None,
+    ) -> List[dict]:
+        """
+        Async search(): calls match_documents over the shared async connection pool.
+        """
+        params, query = self._match_args(project_id, vector, k, filter, document_ids)
+        return self._hits(await self._clients.arpc("match_documents", params, query=query))
+
+    async def asearch_many(
+        self,
+        project_id: int,
+        vectors: List[List[float]],
+        k: int,
+        filter: Optional[dict] = None,
+        document_ids: Optional[Collection[int]] = None,
+    ) -> List[List[dict]]:
+        return list(await asyncio.gather(*(
+            self.asearch(project_id, vector, k, filter=filter, document_ids=document_ids) for vector in vectors
+        )))
+
+    def _document_pages(self, document_id: int, columns: str) -> Iterator[list]:
+        start = 0
+        while True:
+            # Page through the rows (PostgREST caps the rows per response)
+            rows = self._clients.request("GET", self.TABLE_PATH, params={
+                "select": columns,
+                "metadata->>document_id": f"eq.{document_id}",
+                "order": "id",
+                "offset": str(start),
+                "limit": str(VECTOR_PAGE_SIZE),
+            }).json()
+            if rows:
+                yield rows
+            if len(rows) < VECTOR_PAGE_SIZE:
+                return
+            start += VECTOR_PAGE_SIZE
+
+    def iter_document_rows(self, project_id: int, document_id: int) -> Iterator[List[VectorRow]]:
+        for rows in self._document_pages(document_id, "content, metadata, embedding"):
+            page = []
+            for row in rows:
+                embedding = row["embedding"]
+                # pgvector columns come back serialized as "[0.1,0.2,...]"
+                vector = json.loads(embedding) if isinstance(embedding, str) else embedding
+                page.append((row["content"], dict(row.get("metadata") or {}), vector))
+            yield page
+
+    def get_chunk_fingerprints(self, project_id: int, document_id: int) -> Dict[str, List[Tuple[str, Optional[int]]]]:
+        fingerprints: Dict[str, List[Tuple[str, Optional[int]]]] = {}
+        for rows in self._document_pages(document_id, "id, chunk_hash:metadata->>chunk_hash, page:metadata->>page"):
+            for row in rows:
+                page = int(row["page"]) if row.get("page") is not None else None
+                fingerprints.setdefault(row.get("chunk_hash") or "", []).append((str(row["id"]), page))
+        return fingerprints
+
+    def update_metadata(self, project_id: int, metadatas: Dict[str, dict]) -> int:
+        def update(item) -> None:
+            vector_id, metadata = item
+            self._clients.request(
+                "PATCH", self.TABLE_PATH, params={"id": f"eq.{vector_id}"},
+                json={"metadata": metadata}, headers={"Prefer": "return=minimal"}
+            )
+
+        # PostgREST has no bulk update of different values: one request per row, run concurrently
+        list(self._pool.map(update, metadatas.items()))
+        return len(metadatas)
+
+    def _delete_where(self, params: Dict[str, str]) -> int:
+        response = self._clients.request(
+            "DELETE", self.TABLE_PATH, params=params, headers={"Prefer": "count=exact,return=minimal"}
+        )
+        # Content-Range: "*/<deleted rows>"
+        total = response.headers.get("content-range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else 0
+
+    def delete(self, project_id: int, ids: List[str]) -> int:
+        deleted = 0
+        # Batched: keeps the id list within URL length limits
+        for i in range(0, len(ids), VECTOR_DELETE_BATCH_SIZE):
+            batch = ids[i:i + VECTOR_DELETE_BATCH_SIZE]
+            deleted += self._delete_where({"id": f"in.({','.join(batch)})"})
+        return deleted
+
+    def delete_document(self, project_id: int, document_id: int) -> int:
+        return self._delete_where({"metadata->>document_id": f"eq.{document_id}"})
+
+    def drop_project(self, project_id: int) -> int:
+        return self._delete_where({"metadata->>project_id": f"eq.{project_id}"})
+
+    def document_counts(self) -> Counter:
+        """
+        Vector rows per (project_id, document_id), scanning the table in id order.
+        """
+        counts: Counter = Counter()
+        last_id = None
+        while True:
+            params = {
+                "select": "id, project_id:metadata->>project_id, document_id:metadata->>document_id",
+                "order": "id",
+                "limit": str(VECTOR_PAGE_SIZE),
+            }
+            if last_id is not None:
+                params["id"] = f"gt.{last_id}"
+            rows = self._clients.request("GET", self.TABLE_PATH, params=params).json()
+            for row in rows:
+                if row.get("project_id") and row.get("document_id"):
+                    counts[(int(row["project_id"]), int(row["document_id"]))] += 1
+            if len(rows) < VECTOR_PAGE_SIZE:
+                return counts
+            last_id = rows[-1]["id"]
+
+    def flush(self, project_id: Optional[int] = None):
+        # Every write goes straight to Postgres
+        pass
+
+    def compact(self) -> Optional[dict]:
+        # Dead tuples are reclaimed by Postgres autovacuum; VACUUM can't be issued through PostgREST.
+        return None
+
+class _FaissProject:
+    """
+    One project's index: vectors in a FAISS IndexIDMap2 over inner product (cosine on
+    normalized vectors), chunk text and metadata in a SQLite docstore keyed by the same ids.
+
+    Several server processes may open the same project. Docstore rows are committed per
+    batch with `saved = 0` while their vectors are only in this process's memory (`pending`);
+    save() writes the index file under an exclusive file lock, after merging in what other
+    processes saved, then marks the rows saved and bumps the docstore's index generation.
+    Readers reload the index whenever that generation moved (refresh()). Rows of a process
+    that died before saving stay unsaved: never reused, removed with their document.
+    """
+
+    def __init__(self, directory: str):
+        import faiss
+
+        self._faiss = faiss
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.faiss")
+        self.lock_path = os.path.join(directory, "index.lock")
+        os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(os.path.join(directory, "docstore.sqlite3"), check_same_thread=False, timeout=30)
+        # Readers don't block the writer of another process (and vice versa)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " document_id INTEGER,"
+            " chunk_hash TEXT,"
+            " content TEXT NOT NULL,"
+            " metadata TEXT NOT NULL,"
+            " saved INTEGER NOT NULL DEFAULT 1)"
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(chunks)")}
+        if "saved" not in columns:
+            self.db.execute("ALTER TABLE chunks ADD COLUMN saved INTEGER NOT NULL DEFAULT 1")
+        self.db.execute("CREATE INDEX IF NOT EXISTS ix_chunks_document_id ON chunks (document_id)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS index_state (id INTEGER PRIMARY KEY CHECK (id = 1), generation INTEGER NOT NULL)")
+        self.db.execute("INSERT OR IGNORE INTO index_state (id, generation) VALUES (1, 0)")
+        self.db.commit()
+
+        self.index = None
+        self.writable = False
+        # Index generation the in-memory index was read at (None = not read yet)
+        self.generation: Optional[int] = None
+        # Batches added by this process that are not in the index file yet: [(ids, matrix)]
+        self.pending: List[tuple] = []
+        # Set while pending batches exist
+        self.unsaved_since: Optional[float] = None
+        self.refresh()
+
+    def _read(self, mmap: bool):
+        faiss = self._faiss
+        if mmap:
+            # Map the file instead of copying it into memory where this faiss build supports it
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+            try:
+                return faiss.read_index(self.index_path, flags)
+            except Exception:
+                pass
+        self.writable = True
+        return faiss.read_index(self.index_path)
+
+    def refresh(self):
+        """
+        Reloads the index if another process saved it since it was read, re-adding this
+        process's pending batches on top.
+        """
+        generation = self.db.execute("SELECT generation FROM index_state").fetchone()[0]
+        if generation == self.generation:
+            return
+        self.index = None
+        self.writable = False
+        if os.path.exists(self.index_path):
+            self.index = self._read(mmap=not self.pending)
+        for ids, matrix in self.pending:
+            self.ensure_writable(matrix.shape[1])
+            self.index.add_with_ids(matrix, ids)
+        self.generation = generation
+
+    def ensure_writable(self, dim: int):
+        # A memory-mapped index is read-only: loaded into memory once per opened project
+        if self.index is None:
+            self.index = self._faiss.IndexIDMap2(self._faiss.IndexFlatIP(dim))
+            self.writable = True
+        elif not self.writable:
+            self.index = self._read(mmap=False)
+
+    @contextmanager
+    def file_lock(self):
+        """
+        Exclusive across processes for the whole read-modify-write of the index file.
+        """
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write(self):
+        """
+        Writes the index file and marks the pending rows saved, in one docstore transaction
+        with the generation bump. Call under file_lock() right after refresh().
+        """
+        if self.index is not None:
+            tmp_path = self.index_path + ".tmp"
+            self._faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+        try:
+            for ids, _ in self.pending:
+                self.db.executemany("UPDATE chunks SET saved = 1 WHERE id = ?", [(int(i),) for i in ids])
+            self.db.execute("UPDATE index_state SET generation = generation + 1")
+            self.generation = self.db.execute("SELECT generation FROM index_state").fetchone()[0]
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            # Unknown to other processes: re-read from disk next time
+            self.generation = None
+            raise
+        self.pending = []
+        self.unsaved_since = None
+
+    def save(self):
+        with self.file_lock():
+            self.refresh()
+            self.write()
+
+    def discard_pending(self, ids: Collection[int]):
+        import numpy as np
+
+        remaining = []
+        for batch_ids, matrix in self.pending:
+            keep = ~np.isin(batch_ids, np.asarray(list(ids), dtype=np.int64))
+            if keep.any():
+                remaining.append((batch_ids[keep], matrix[keep]))
+        self.pending = remaining
+
+    def selector_ids(self, filter: Optional[dict], document_ids: Optional[Collection[int]] = None) -> Optional[List[int]]:
+        if not filter and document_ids is None:
+            return None
+        clauses = []
+        params = []
+        for key, value in (filter or {}).items():
+            if not _FILTER_KEY.match(key):
+                raise ValueError(f"Invalid metadata filter key: {key!r}")
+            if key == "document_id":
+                clauses.append("document_id = ?")
+            else:
+                clauses.append(f"json_extract(metadata, '$.{key}') = ?")
+            params.append(value)
+        if document_ids is not None:
+            clauses.append(f"document_id IN ({','.join('?' * len(document_ids))})")
+            params.extend(document_ids)
+        rows = self.db.execute(f"SELECT id FROM chunks WHERE {' AND '.join(clauses)}", params)
+        return [row[0] for row in rows]
+
+class FaissBackend:
+    """
+    FAISS index per project, persisted under FAISS_INDEX_DIR/project_<id>/ and safe to share
+    between server processes (see _FaissProject). Indexes are opened lazily (memory-mapped
+    when possible) and kept in an LRU of open projects. Docstore rows are committed per batch;
+    the index file is written by flush() (once per document, or after FAISS_SAVE_INTERVAL_SECONDS).
+    """
+    name = "faiss"
+
+    def __init__(self, directory: str):
+        import faiss  # noqa: F401  (fail fast if faiss-cpu is missing)
+
+        self._directory = directory
+        self._projects = LRUCache(max_size=settings.FAISS_MAX_OPEN_INDEXES)
+        self._locks: Dict[int, threading.RLock] = defaultdict(threading.RLock)
+        self._open_lock = threading.Lock()
+        # Projects with deletions not yet compacted
+        self._dirty = set()
+        # Projects with unsaved vectors; held here so LRU eviction cannot drop them
+        self._unsaved: Dict[int, _FaissProject] = {}
+
+    def _project(self, project_id: int) -> _FaissProject:
+        project = self._unsaved.get(project_id) or self._projects.get(project_id)
+        if project is None:
+            with self._open_lock:
+                project = self._projects.get(project_id)
+                if project is None:
+                    project = _FaissProject(os.path.join(self._directory, f"project_{project_id}"))
+                    self._projects.set(project_id, project)
+        return project
+
+    def add_vectors(self, project_id: int, texts: List[str], vectors: List[List[float]], metadatas: List[dict]) -> List[str]:
+        import numpy as np
+
+        with self._locks[project_id]:
+            project = self._project(project_id)
+            project.refresh()
+            matrix = np.asarray(vectors, dtype=np.float32)
+            project.ensure_writable(matrix.shape[1])
+            project._faiss.normalize_L2(matrix)
+
+            ids = None
+            try:
+                # One write transaction: the batch's ids are contiguous
+                project.db.executemany(
+                    "INSERT INTO chunks (document_id, chunk_hash, content, metadata, saved) VALUES (?, ?, ?, ?, 0)",
+                    [(meta.get("document_id"), meta.get("chunk_hash"), text, json.dumps(meta)) for text, meta in zip(texts, metadatas)]
+                )
+                last_id = project.db.execute("SELECT last_insert_rowid()").fetchone()[0]
+                ids = np.arange(last_id - len(texts) + 1, last_id + 1, dtype=np.int64)
+                project.index.add_with_ids(matrix, ids)
+                project.db.commit()
+            except Exception:
+                if ids is not None:
+                    project.index.remove_ids(project._faiss.IDSelectorBatch(ids))
+                project.db.rollback()
+                raise
+
+            project.pending.append((ids, matrix))
+            if project.unsaved_since is None:
+                project.unsaved_since = time.monotonic()
+            self._unsaved[project_id] = project
+            if time.monotonic() - project.unsaved_since > settings.FAISS_SAVE_INTERVAL_SECONDS:
+                self._flush(project_id, project)
+            return [str(i) for i in ids]
+
+    def _flush(self, project_id: int, project: _FaissProject):
+        try:
+            project.save()
+        except Exception:
+            # The batches stay pending (their rows unsaved) and are retried by the next flush
+            logger.error(f"Failed to save FAISS index of project {project_id}")
+            raise
+        self._unsaved.pop(project_id, None)
+
+    def flush(self, project_id: Optional[int] = None):
+        """
+        Writes unsaved vectors of a project (or of all projects) to disk.
+        """
+        for pid in [project_id] if project_id is not None else list(self._unsaved):
+            with self._locks[pid]:
+                project = self._unsaved.get(pid)
+                if project is not None:
+                    self._flush(pid, project)
+
+    def search(
+        self,
+        project_id: int,
+        vector: List[float],
+        k: int,
+        filter: Optional[dict] = None,
+        document_ids: Optional[Collection[int]] = None,
+    ) -> List[dict]:
+        return self.search_many(project_id, [vector], k, filter=filter, document_ids=document_ids)[0]
+
+    def search_many(
+        self,
+        project_id: int,
+        vectors: List[List[float]],
+        k: int,
+        filter: Optional[dict] = None,
+        document_ids: Optional[Collection[int]] = None,
+    ) -> List[List[dict]]:
+        """
+        Searches all query vectors in one index.search call.
+        """
+        import numpy as np
+
+        with self._locks[project_id]:
+            project = self._project(project_id)
+            project.refresh()
+            if project.index is None or project.index.ntotal == 0:
+                return [[] for _ in vectors]
+
+            queries = np.asarray(vectors, dtype=np.float32)
+            project._faiss.normalize_L2(queries)
+
+            params = None
+            # Restrict the search itself to the allowed rows, so the top k all qualify
+            allowed = project.selector_ids(filter, document_ids)
+            if allowed is not None:
+                if not allowed:
+                    return [[] for _ in vectors]
+                params = project._faiss.SearchParameters(
+                    sel=project._faiss.IDSelectorBatch(np.asarray(allowed, dtype=np.int64))
+                )
+            scores, ids = project.index.search(queries, k, params=params)
+
+            hits = [[int(i) for i in row if i != -1] for row in ids]
+            unique_ids = sorted({i for row in hits for i in row})
+            if not unique_ids:
+                return [[] for _ in vectors]
+            rows = {
+                row[0]: row
+                for row in project.db.execute(
+                    f"SELECT id, content, metadata FROM chunks WHERE id IN ({','.join('?' * len(unique_ids))})",
+                    unique_ids
+                )
+            }
+        return [
+            [{"content": rows[i][1], "metadata": json.loads(rows[i][2])} for i in row if i in rows]
+            for row in hits
+        ]
+
+    async def asearch_many(
+        self,
+        project_id: int,
+        vectors: List[List[float]],
+        k: int,
+        filter: Optional[dict] = None,
+        document_ids: Optional[Collection[int]] = None,
+    ) -> List[List[dict]]:
+        # In-process and CPU-bound: keep it off the event loop
+        return await asyncio.to_thread(self.search_many, project_id, vectors, k, filter, document_ids)
+
+    def iter_document_rows(self, project_id: int, document_id: int) -> Iterator[List[VectorRow]]:
+        with self._locks[project_id]:
+            project = self._project(project_id)
+            # Rows this process hasn't saved may be another process's pending batch (or a crashed one's)
+            rows = project.db.execute(
+                "SELECT id, content, metadata FROM chunks WHERE document_id = ? AND saved = 1 ORDER BY id", (document_id,)
+            ).fetchall()
+            # After the query: rows are marked saved only once the file has them
+            project.refresh()
+            if project.index is None:
+                return
+            page = [(content, json.loads(meta), project.index.reconstruct(int(i)).tolist()) for i, content, meta in rows]
+        for i in range(0, len(page), VECTOR_PAGE_SIZE):
+            yield page[i:i + VECTOR_PAGE_SIZE]
+
+    def get_chunk_fingerprints(self, project_id: int, document_id: int) -> Dict[str, List[Tuple[str, Optional[int]]]]:
+        fingerprints: Dict[str, List[Tuple[str, Optional[int]]]] = {}
+        with self._locks[project_id]:
+            rows = self._project(project_id).db.execute(
+                "SELECT id, chunk_hash, json_extract(metadata, '$.page') FROM chunks"
+                " WHERE document_id = ? AND saved = 1 ORDER BY id",
+                (document_id,)
+            )
+            for vector_id, chunk_hash, page in rows:
+                fingerprints.setdefault(chunk_hash or "", []).append((str(vector_id), page))
+        return fingerprints
+
+    def update_metadata(self, project_id: int, metadatas: Dict[str, dict]) -> int:
+        with self._locks[project_id]:
+            project = self._project(project_id)
+            cursor = project.db.executemany(
+                "UPDATE chunks SET chunk_hash = ?, metadata = ? WHERE id = ?",
+                [(metadata.get("chunk_hash"), json.dumps(metadata), int(vector_id)) for vector_id, metadata in metadatas.items()]
+            )
+            project.db.commit()
+            return cursor.rowcount
+
+    def delete(self, project_id: int, ids: List[str]) -> int:
+        import numpy as np
+
+        if not ids:
+            return 0
+        int_ids = [int(i) for i in ids]
+        with self._locks[project_id]:
+            project = self._project(project_id)
+            with project.file_lock():
+                project.refresh()
+                removed = 0
+                if project.index is not None:
+                    project.ensure_writable(project.index.d)
+                    removed = project.index.remove_ids(project._faiss.IDSelectorBatch(np.asarray(int_ids, dtype=np.int64)))
+                project.discard_pending(int_ids)
+                project.db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in int_ids])
+                # Also saves this process's pending batches
+                project.write()
+            self._unsaved.pop(project_id, None)
+            self._dirty.add(project_id)
+            return int(removed)
+
+    def delete_document(self, project_id: int, document_id: int) -> int:
+        with self._locks[project_id]:
+            ids = [
+                str(row[0]) for row in
+                self._project(project_id).db.execute("SELECT id FROM chunks WHERE document_id = ?", (document_id,))
+            ]
+            return self.delete(project_id, ids)
+
+    def _project_ids(self) -> List[int]:
+        if not os.path.isdir(self._directory):
+            return []
+        return [
+            int(name[len("project_"):]) for name in os.listdir(self._directory)
+            if name.startswith("project_") and name[len("project_"):].isdigit()
+        ]
+
+    def drop_project(self, project_id: int) -> int:
+        with self._locks[project_id]:
+            project = self._project(project_id)
+            count = project.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            project.db.close()
+            self._projects.pop(project_id)
+            self._unsaved.pop(project_id, None)
+            shutil.rmtree(project.directory, ignore_errors=True)
+        return count
+
+    def document_counts(self) -> Counter:
+        counts: Counter = Counter()
+        for project_id in self._project_ids():
+            with self._locks[project_id]:
+                rows = self._project(project_id).db.execute(
+                    "SELECT document_id, COUNT(*) FROM chunks GROUP BY document_id"
+                )
+                for document_id, count in rows:
+                    counts[(project_id, document_id)] = count
+        return counts
+
+    def compact(self) -> Optional[dict]:
+        """
+        Vacuums the docstores of projects that lost chunks since the last compaction.
+        The index files need nothing: remove_ids shrinks a flat index and it is rewritten on every save.
+        """
+        freed = 0
+        dirty, self._dirty = self._dirty, set()
+        for project_id in dirty & set(self._project_ids()):
+            with self._locks[project_id]:
+                project = self._project(project_id)
+                path = os.path.join(project.directory, "docstore.sqlite3")
+                before = os.path.getsize(path)
+                project.db.execute("VACUUM")
+                freed += before - os.path.getsize(path)
+        return {"projects": len(dirty), "bytes_freed": freed}
+
+def build_vector_store(supabase_clients=None):
+    """
+    Creates the backend selected by VECTOR_STORE_BACKEND ("supabase" or "faiss").
+    Returns None when the selected backend isn't configured.
+    """
+    if settings.VECTOR_STORE_BACKEND == "faiss":
+        logger.info(f"Using local FAISS vector store at {settings.FAISS_INDEX_DIR}")
+        return FaissBackend(settings.FAISS_INDEX_DIR)
+    if settings.VECTOR_STORE_BACKEND == "supabase":
+        if supabase_clients is None or not supabase_clients.configured:
+            logger.warning("Supabase credentials missing. RAG service limited.")
+            return None
+        logger.info("Supabase Vector Store initialized.")
+        return SupabaseBackend(supabase_clients)
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {settings.VECTOR_STORE_BACKEND}")
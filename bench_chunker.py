@@ -0,0 +1,91 @@
+import os
+import random
+import sys
+import time
+
+# Settings are loaded on import; the benchmark needs no real credentials.
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("GOOGLE_API_KEY", "bench")
+
+from pypdf import PdfReader
+from backend.app.services.ingestion import (
+    _get_splitter, chunk_spans, clean_text, clean_text_fast
+)
+
+PDF_PATH = sys.argv[1] if len(sys.argv) > 1 else "test.pdf"
+ROUNDS = 5
+
+def recursive_chunker(pages: list[str]) -> list[str]:
+    splitter = _get_splitter()
+    chunks = []
+    for raw in pages:
+        text = clean_text(raw)
+        if text:
+            chunks.extend(splitter.split_text(text))
+    return chunks
+
+def native_chunker(pages: list[str]) -> list[str]:
+    chunks = []
+    for raw in pages:
+        text = clean_text_fast(raw)
+        chunks.extend(text[start:end] for start, end in chunk_spans(text))
+    return chunks
+
+def synthetic_pages(page_count: int, seed: int = 42) -> list[str]:
+    """
+    Paper-like raw page text: sentences, hyphenated line breaks, blank lines and ragged spacing.
+    """
+    rng = random.Random(seed)
+    vocab = ["transformer", "attention", "dataset", "baseline", "accuracy", "BLEU", "ImageNet",
+             "we", "the", "of", "model", "propose", "evaluate", "results", "training", "loss"]
+    pages = []
+    for _ in range(page_count):
+        lines = []
+        for _ in range(rng.randint(40, 60)):
+            words = [rng.choice(vocab) for _ in range(rng.randint(8, 14))]
+            if rng.random() < 0.1:
+                words[-1] = words[-1][:3] + "-"  # hyphenated line break
+            line = "  ".join(words) if rng.random() < 0.2 else " ".join(words)
+            lines.append(line + (". " if rng.random() < 0.3 else ""))
+            if rng.random() < 0.1:
+                lines.append("")
+        pages.append("\n".join(lines))
+    return pages
+
+# Edge cases clean_text_fast() must clean exactly like clean_text()
+PARITY_CASES = [
+    "-a-\na-\na",  # chained hyphenated line breaks: a joined word is not joined again
+    "ab-\n\n  cd-\t\nef gh-  \n\nij",
+    "x- \n y  \t z\n\n\n",
+]
+
+def check_cleaning(pages: list[str]):
+    mismatches = [text for text in PARITY_CASES + pages if clean_text(text) != clean_text_fast(text)]
+    print(f"clean_text parity: {len(mismatches)} mismatches")
+    for text in mismatches[:3]:
+        print(f"  {text[:80]!r}")
+
+def bench(label: str, pages: list[str]):
+    print(f"\n== {label}: {len(pages)} pages, {sum(map(len, pages)) / 1e6:.2f}M chars")
+    for name, chunker in (("recursive", recursive_chunker), ("native", native_chunker)):
+        best = float("inf")
+        for _ in range(ROUNDS):
+            t0 = time.perf_counter()
+            chunks = chunker(pages)
+            best = min(best, time.perf_counter() - t0)
+        sizes = [len(c) for c in chunks] or [0]
+        print(
+            f"{name:>10}: {best * 1000:8.1f} ms  chunks={len(chunks):6d}  "
+            f"avg={sum(sizes) / len(sizes):7.1f}  max={max(sizes)}"
+        )
+
+if __name__ == "__main__":
+    try:
+        reader = PdfReader(PDF_PATH)
+        bench(PDF_PATH, [page.extract_text() for page in reader.pages])
+    except Exception as e:
+        print(f"Skipping {PDF_PATH}: {e}")
+
+    check_cleaning(synthetic_pages(300))
+    for page_count in (50, 300, 600):
+        bench(f"synthetic-{page_count}", synthetic_pages(page_count))
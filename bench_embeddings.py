@@ -0,0 +1,69 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+# Settings are loaded on import; the benchmark needs no real credentials.
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("GOOGLE_API_KEY", "bench")
+
+import numpy as np
+from backend.app.services.embeddings import build_embeddings
+
+# Compares the ONNX backend against the reference HuggingFace model:
+#   python bench_embeddings.py --onnx-path models/all-MiniLM-L6-v2-onnx
+# Exits non-zero if cosine agreement falls below the thresholds.
+
+parser = argparse.ArgumentParser(description="ONNX vs HuggingFace embedding parity and throughput.")
+parser.add_argument("--onnx-path", default=os.environ.get("ONNX_MODEL_PATH"))
+parser.add_argument("--onnx-file", default="model_quantized.onnx")
+parser.add_argument("--texts", type=int, default=512)
+parser.add_argument("--min-cosine", type=float, default=0.97)
+parser.add_argument("--mean-cosine", type=float, default=0.99)
+args = parser.parse_args()
+
+if not args.onnx_path:
+    sys.exit("Pass --onnx-path or set ONNX_MODEL_PATH (see export_onnx_model.py).")
+
+from backend.app.core.config import settings
+settings.ONNX_MODEL_PATH = args.onnx_path
+settings.ONNX_MODEL_FILE = args.onnx_file
+
+def sample_texts(count: int, seed: int = 7) -> list[str]:
+    """
+    Query-sized and chunk-sized academic-looking texts.
+    """
+    rng = random.Random(seed)
+    vocab = ["transformer", "attention", "dataset", "baseline", "accuracy", "BLEU", "ImageNet", "we",
+             "the", "of", "model", "propose", "evaluate", "results", "training", "loss", "limitations",
+             "future", "work", "methodology", "convolutional", "benchmark", "ablation", "F1"]
+    texts = ["limitations", "future work", "conclusion", "methodology"]
+    while len(texts) < count:
+        length = rng.choice([6, 12, 40, 180])
+        texts.append(" ".join(rng.choice(vocab) for _ in range(length)))
+    return texts
+
+def run(embeddings, texts: list[str]) -> tuple[np.ndarray, float]:
+    embeddings.embed_documents(texts[:8])  # warm-up
+    t0 = time.perf_counter()
+    vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+    return vectors, time.perf_counter() - t0
+
+texts = sample_texts(args.texts)
+reference, ref_time = run(build_embeddings("huggingface"), texts)
+candidate, onnx_time = run(build_embeddings("onnx"), texts)
+
+reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+candidate /= np.linalg.norm(candidate, axis=1, keepdims=True)
+cosines = (reference * candidate).sum(axis=1)
+
+print(f"texts: {len(texts)}")
+print(f"huggingface: {len(texts) / ref_time:8.1f} texts/s")
+print(f"onnx:        {len(texts) / onnx_time:8.1f} texts/s  ({ref_time / onnx_time:.2f}x)")
+print(f"cosine agreement: mean={cosines.mean():.4f} min={cosines.min():.4f}")
+
+if cosines.min() < args.min_cosine or cosines.mean() < args.mean_cosine:
+    print("FAIL: ONNX embeddings diverge from the reference model.")
+    sys.exit(1)
+print("OK")
@@ -0,0 +1,124 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Settings are loaded on import; the benchmark needs no real credentials.
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("GOOGLE_API_KEY", "bench")
+
+import numpy as np
+from backend.app.core.config import settings
+from backend.app.services.embeddings import build_embeddings
+from backend.app.services.ingestion import chunk_fingerprint, iter_chunks
+from backend.app.services.sparse_index import SparseIndex, reciprocal_rank_fusion, tokenize
+
+# Retrieval quality and latency of dense, BM25 and hybrid (RRF) search over local PDFs:
+#   python bench_retrieval.py paper1.pdf paper2.pdf --queries 200
+# Queries are generated from sampled chunks, so the source chunk is the known answer:
+#   keyword  - the chunk's rarest terms (dataset/metric/model names, acronyms)
+#   sentence - one sentence of the chunk, as a natural-language question would paraphrase it
+# hybrid/dN rows fuse N dense candidates with BM25, showing how small HYBRID_DENSE_K can go.
+
+parser = argparse.ArgumentParser(description="Dense vs BM25 vs hybrid retrieval benchmark.")
+parser.add_argument("pdfs", nargs="+")
+parser.add_argument("--queries", type=int, default=100, help="Queries per kind")
+parser.add_argument("-k", type=int, default=5)
+parser.add_argument(
+    "--dense-k", type=int, nargs="+", default=None,
+    help="Dense candidate caps to compare in hybrid mode (default: 2, 4 and HYBRID_DENSE_K)"
+)
+parser.add_argument("--sparse-k", type=int, default=settings.HYBRID_SPARSE_K)
+parser.add_argument("--seed", type=int, default=7)
+args = parser.parse_args()
+
+texts = []
+metadatas = []
+for document_id, path in enumerate(args.pdfs):
+    with open(path, "rb") as f:
+        for chunk in iter_chunks(f, os.path.basename(path)):
+            meta = chunk["metadata"]
+            meta["document_id"] = document_id
+            meta["chunk_hash"] = chunk_fingerprint(chunk["text"])
+            texts.append(chunk["text"])
+            metadatas.append(meta)
+if not texts:
+    sys.exit("No text extracted from the given PDFs.")
+print(f"chunks: {len(texts)} from {len(args.pdfs)} PDF(s)")
+
+# Sparse index
+sparse = SparseIndex(os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+t0 = time.perf_counter()
+sparse.add(texts, metadatas)
+print(f"sparse build: {time.perf_counter() - t0:.2f}s  {sparse.stats()}")
+
+# Dense index (exact cosine, so only the retriever itself is compared)
+embeddings = build_embeddings()
+t0 = time.perf_counter()
+matrix = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+print(f"dense build:  {time.perf_counter() - t0:.2f}s")
+
+def dense_search(query: str, k: int) -> list[dict]:
+    vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    scores = matrix @ (vector / np.linalg.norm(vector))
+    top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+    top = top[np.argsort(-scores[top])]
+    return [{"content": texts[i], "metadata": metadatas[i]} for i in top]
+
+def sparse_search(query: str, k: int) -> list[dict]:
+    return sparse.search(query, k)
+
+def hybrid_search(dense_k: int):
+    # Same candidate counts as RAGService in hybrid mode
+    def search(query: str, k: int) -> list[dict]:
+        ranked = [dense_search(query, min(k, dense_k)), sparse_search(query, max(k, args.sparse_k))]
+        return reciprocal_rank_fusion(ranked, k=k, rrf_k=settings.RRF_K)
+    return search
+
+dense_ks = sorted({min(args.k, dense_k) for dense_k in args.dense_k or [2, 4, settings.HYBRID_DENSE_K]})
+
+# Queries
+document_frequency = {}
+for text in texts:
+    for term in set(tokenize(text)):
+        document_frequency[term] = document_frequency.get(term, 0) + 1
+
+rng = random.Random(args.seed)
+keyword_queries = []
+sentence_queries = []
+for i in rng.sample(range(len(texts)), min(args.queries, len(texts))):
+    terms = sorted(set(tokenize(texts[i])), key=lambda t: (document_frequency[t], t))
+    if len(terms) >= 3:
+        keyword_queries.append((" ".join(terms[:3]), metadatas[i]["chunk_hash"]))
+    sentences = [s.strip() for s in texts[i].split(". ") if len(s.split()) >= 8]
+    if sentences:
+        sentence_queries.append((rng.choice(sentences), metadatas[i]["chunk_hash"]))
+
+def evaluate(search, queries: list[tuple[str, str]]) -> tuple[float, float, float]:
+    hits = 0
+    reciprocal_ranks = 0.0
+    latencies = []
+    for query, answer in queries:
+        t0 = time.perf_counter()
+        results = search(query, args.k)
+        latencies.append(time.perf_counter() - t0)
+        ranked = [r["metadata"]["chunk_hash"] for r in results]
+        if answer in ranked:
+            hits += 1
+            reciprocal_ranks += 1 / (ranked.index(answer) + 1)
+    return hits / len(queries), reciprocal_ranks / len(queries), 1000 * statistics.median(latencies)
+
+dense_search("warm-up", args.k)
+modes = [("dense", dense_search), ("bm25", sparse_search)]
+modes += [(f"hybrid/d{dense_k}", hybrid_search(dense_k)) for dense_k in dense_ks]
+print(f"\n{'queries':<10}{'mode':<12}{'recall@' + str(args.k):>10}{'mrr':>8}{'p50 ms':>9}")
+for kind, queries in (("keyword", keyword_queries), ("sentence", sentence_queries)):
+    if not queries:
+        continue
+    for mode, search in modes:
+        recall, mrr, latency = evaluate(search, queries)
+        print(f"{kind:<10}{mode:<12}{recall:>10.3f}{mrr:>8.3f}{latency:>9.2f}")
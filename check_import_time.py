@@ -0,0 +1,70 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Fails (exit 1) if importing the API app regresses past a time budget, or if it
+# pulls in the embedding model stack at import time (that must stay lazy, see /ready).
+#   python check_import_time.py [--budget 3.0] [--runs 3]
+
+HEAVY_MODULES = ("torch", "sentence_transformers", "onnxruntime")
+
+parser = argparse.ArgumentParser(description="Import-time budget check for backend.app.main.")
+parser.add_argument("--module", default="backend.app.main")
+parser.add_argument("--budget", type=float, default=3.0, help="Seconds allowed for the import")
+parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to try (best run counts)")
+parser.add_argument("--top", type=int, default=15, help="Slowest modules to print")
+args = parser.parse_args()
+
+env = dict(os.environ)
+env.setdefault("SECRET_KEY", "import-check")
+env.setdefault("GOOGLE_API_KEY", "import-check")
+# Keep startup hooks and credentials out of the measurement
+env["SUPABASE_URL"] = ""
+env["SUPABASE_KEY"] = ""
+
+probe = (
+    "import sys, time\n"
+    "t0 = time.perf_counter()\n"
+    f"import {args.module}\n"
+    "print(f'IMPORT_SECONDS={time.perf_counter() - t0:.4f}')\n"
+    f"print('HEAVY=' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+)
+
+best = None
+importtime_log = ""
+heavy = ""
+for _ in range(args.runs):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        capture_output=True, text=True, env=env
+    )
+    if result.returncode != 0:
+        print(result.stderr[-4000:])
+        sys.exit(f"Importing {args.module} failed.")
+    seconds = float(re.search(r"IMPORT_SECONDS=([\d.]+)", result.stdout).group(1))
+    heavy = re.search(r"HEAVY=(.*)", result.stdout).group(1)
+    if best is None or seconds < best:
+        best = seconds
+        importtime_log = result.stderr
+
+# -X importtime lines: "import time: self [us] | cumulative | imported package"
+rows = []
+for line in importtime_log.splitlines():
+    match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|\s+(.*)", line)
+    if match:
+        rows.append((int(match.group(2)), match.group(3).rstrip()))
+print(f"Slowest imports (cumulative) for {args.module}:")
+for cumulative, name in sorted(rows, reverse=True)[:args.top]:
+    print(f"  {cumulative / 1e6:7.3f}s  {name}")
+
+print(f"\nImport time: {best:.3f}s (budget {args.budget:.3f}s)")
+failed = False
+if best > args.budget:
+    print("FAIL: import time over budget.")
+    failed = True
+if heavy:
+    print(f"FAIL: model libraries imported eagerly: {heavy}")
+    failed = True
+sys.exit(1 if failed else 0)
@@ -0,0 +1,29 @@
+import argparse
+import os
+
+# Exports a sentence-transformers model to ONNX and writes an int8 dynamically-quantized copy.
+# Requires: pip install "optimum[onnxruntime]"
+# Then set EMBEDDING_BACKEND=onnx and ONNX_MODEL_PATH=<output dir>.
+
+parser = argparse.ArgumentParser(description="Export an embedding model to quantized ONNX.")
+parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+parser.add_argument("--output", default="models/all-MiniLM-L6-v2-onnx")
+args = parser.parse_args()
+
+from optimum.onnxruntime import ORTModelForFeatureExtraction
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from transformers import AutoTokenizer
+
+print(f"Exporting {args.model} to {args.output}...")
+model = ORTModelForFeatureExtraction.from_pretrained(args.model, export=True)
+model.save_pretrained(args.output)
+# Writes tokenizer.json, which OnnxEmbeddings loads with the `tokenizers` package
+AutoTokenizer.from_pretrained(args.model).save_pretrained(args.output)
+
+print("Quantizing weights to int8...")
+quantize_dynamic(
+    os.path.join(args.output, "model.onnx"),
+    os.path.join(args.output, "model_quantized.onnx"),
+    weight_type=QuantType.QInt8,
+)
+print("Export complete.")
@@ -1,5 +1,44 @@
 import api from './api';
 
+// POSTs to a server-sent-events endpoint and calls onToken(text) per generated fragment.
+// Resolves with the final `done` payload (which includes the full answer).
+const streamEvents = async (url, body, onToken) => {
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${api.defaults.baseURL}${url}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            ...(token ? { Authorization: `Bearer ${token}` } : {}),
+        },
+        body: JSON.stringify(body),
+    });
+    if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || `Request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const event = raw.match(/^event: (.*)$/m)?.[1];
+            const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+            if (event === 'token') onToken?.(data.text);
+            else if (event === 'done') return data;
+            else if (event === 'error') throw new Error(data.detail);
+        }
+    }
+    throw new Error('Stream ended unexpectedly');
+};
+
 export const workspaceService = {
     getDocuments: async (projectId) => {
         const response = await api.get(`/projects/${projectId}/documents`);
@@ -25,6 +64,22 @@ export const workspaceService = {
         return response.data;
     },
 
+    reindexDocument: async (projectId, documentId, file) => {
+        const formData = new FormData();
+        formData.append('file', file);
+        const response = await api.post(`/projects/${projectId}/documents/${documentId}/reindex`, formData, {
+            headers: {
+                'Content-Type': 'multipart/form-data',
+            }
+        });
+        return response.data;
+    },
+
+    getIngestionJob: async (projectId, jobId) => {
+        const response = await api.get(`/projects/${projectId}/documents/jobs/${jobId}`);
+        return response.data;
+    },
+
     deleteDocument: async (projectId, documentId) => {
         await api.delete(`/projects/${projectId}/documents/${documentId}`);
     },
@@ -37,6 +92,9 @@ export const workspaceService = {
         return response.data;
     },
 
+    chatStream: (projectId, query, documentIds = [], onToken) =>
+        streamEvents(`/projects/${projectId}/query/chat/stream`, { query, document_ids: documentIds }, onToken),
+
     async getMessages(projectId, type = 'chat') {
         const response = await api.get(`/projects/${projectId}/messages`, { params: { type } });
         return response.data;
@@ -47,6 +105,9 @@ export const workspaceService = {
         return response.data;
     },
 
+    deepResearchStream: (projectId, query, onToken) =>
+        streamEvents(`/projects/${projectId}/query/research/stream`, { query }, onToken),
+
     analyze: async (projectId) => {
         const response = await api.post(`/projects/${projectId}/query/analyze`);
         return response.data;
@@ -0,0 +1,39 @@
+from sqlalchemy import inspect, text
+from backend.app.db.base import engine
+
+# Columns added to existing tables after their first release.
+# create_all() only creates missing tables, so these are applied here.
+# (table, column, DDL type, indexed)
+NEW_COLUMNS = [
+    ("documents", "content_hash", "VARCHAR", True),
+    ("analysis_results", "fingerprint", "VARCHAR", False),
+    ("documents", "embedding_model", "VARCHAR", False),
+    ("documents", "chunker_config", "VARCHAR", False),
+]
+
+print(f"Migrating database at: {engine.url.render_as_string(hide_password=True)}")
+
+try:
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl_type, indexed in NEW_COLUMNS:
+            if not inspector.has_table(table):
+                print(f"Table {table} missing, it will be created on startup.")
+                continue
+
+            columns = [info["name"] for info in inspector.get_columns(table)]
+            if column not in columns:
+                print(f"Adding {table}.{column}...")
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+                print("Column added successfully.")
+            else:
+                print(f"Column {table}.{column} already exists.")
+
+            if indexed:
+                # Same name SQLAlchemy uses for index=True columns
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"))
+
+    print("Migration complete.")
+
+except Exception as e:
+    print(f"Migration failed: {e}")